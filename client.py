@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
 
-import os, subprocess, re, contextlib, requests, time, json, shutil
+import os, subprocess, re, contextlib, requests, time, json, shutil, hashlib, math, glob
 from tempfile import NamedTemporaryFile
 from threading import Lock, RLock, Thread, Event, Condition
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from collections import deque
 
 bytes_map = ["B", "K", "M", "G"]
@@ -13,6 +13,10 @@ KEY_1 = ord("1")
 KEY_2 = ord("2")
 KEY_3 = ord("3")
 
+PROGRESS_RE = re.compile(rb"frame[^\r\n/]*/([0-9]+) ")
+STATUS_INTERVAL = 0.25
+CACHE_PREFIX = "grav1_"
+
 def n_bytes(num_bytes):
   if num_bytes / 1024 < 1: return (num_bytes, 0)
   r = n_bytes(num_bytes / 1024)
@@ -26,10 +30,157 @@ def print_progress_bytes(n, total):
   fill = "█" * int((n / total) * 10)
   return "{:3.0f}%|{:{}s}| {}/{}".format(100 * n / total, fill, 10, bytes_str(n), bytes_str(total))
 
+def file_checksum(path):
+  h = hashlib.sha256()
+  with open(path, "rb") as f:
+    for chunk in iter(lambda: f.read(2**20), b""):
+      h.update(chunk)
+  return h.hexdigest()
+
 def print_progress(n, total):
   fill = "█" * int((n / total) * 10)
   return "{:3.0f}%|{:{}s}| {}/{}".format(100 * n / total, fill, 10, n, total)
 
+def probe_fps(ffprobe, path):
+  try:
+    p = subprocess.run([
+      ffprobe, "-v", "error",
+      "-select_streams", "v:0",
+      "-show_entries", "stream=r_frame_rate",
+      "-of", "default=noprint_wrappers=1:nokey=1",
+      path
+    ], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    num, den = p.stdout.decode("utf-8").strip().split("/")
+    return int(num) / int(den)
+  except:
+    return None
+
+def y4m_frame_size(header):
+  w = int(re.search(rb" W([0-9]+)", header).group(1))
+  h = int(re.search(rb" H([0-9]+)", header).group(1))
+  c = re.search(rb" C([0-9a-z]+)", header)
+  c = c.group(1).decode("utf-8") if c else "420"
+  depth = re.search(r"p([0-9]+)", c)
+  sample = 2 if depth and int(depth.group(1)) > 8 else 1
+  planes = 1 if c.startswith("mono") else 3 if c.startswith("444") else 2 if c.startswith("422") else 1.5
+  return len(b"FRAME\n") + int(w * h * planes * sample)
+
+def decode_cache_dirs():
+  return ["/dev/shm", "."] if os.path.isdir("/dev/shm") else ["."]
+
+def decode_y4m(ffmpeg, name, frames, worker):
+  cache_dirs = decode_cache_dirs()
+  while cache_dirs:
+    worker.pipe = subprocess.Popen(ffmpeg, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    pin(worker.pipe, worker.cpus)
+    header = worker.pipe.stdout.readline()
+    if not header.startswith(b"YUV4MPEG2"):
+      worker.pipe.kill()
+      return None
+
+    size = len(header) + frames * y4m_frame_size(header)
+    cache_dir = next((d for d in cache_dirs if shutil.disk_usage(d).free > size * 1.1), cache_dirs[-1])
+    cache_dirs = cache_dirs[cache_dirs.index(cache_dir) + 1:]
+    path = os.path.join(cache_dir, name)
+
+    try:
+      with open(path, "wb") as f:
+        f.write(header)
+        shutil.copyfileobj(worker.pipe.stdout, f, 2**22)
+    except:
+      worker.pipe.kill()
+      if os.path.exists(path):
+        os.remove(path)
+      if worker.aborted or worker.stopped:
+        return None
+      continue
+
+    if worker.pipe.wait() != 0:
+      os.remove(path)
+      return None
+
+    return path
+
+  return None
+
+def parse_cpulist(cpulist):
+  cpus = []
+  for part in cpulist.strip().split(","):
+    if not part: continue
+    if "-" in part:
+      a, b = part.split("-")
+      cpus.extend(range(int(a), int(b) + 1))
+    else:
+      cpus.append(int(part))
+  return cpus
+
+def cpu_nodes():
+  if hasattr(os, "sched_getaffinity"):
+    cpus = sorted(os.sched_getaffinity(0))
+  else:
+    cpus = list(range(os.cpu_count() or 1))
+
+  nodes = []
+  for path in sorted(glob.glob("/sys/devices/system/node/node[0-9]*/cpulist")):
+    try:
+      node = [cpu for cpu in parse_cpulist(open(path).read()) if cpu in cpus]
+    except:
+      continue
+    if node:
+      nodes.append(node)
+
+  if sum(len(node) for node in nodes) != len(cpus):
+    return [cpus]
+  return nodes
+
+def auto_threads(nodes):
+  return min(4, max(1, sum(len(node) for node in nodes) // 8))
+
+def partition_cpus(nodes, n):
+  total = sum(len(node) for node in nodes)
+  if n <= 0: return []
+  if n > total: return [None] * n
+
+  counts = [n * len(node) // total for node in nodes]
+  by_remainder = sorted(range(len(nodes)), key=lambda i: n * len(nodes[i]) % total, reverse=True)
+  for i in by_remainder[:n - sum(counts)]:
+    counts[i] += 1
+
+  sets = []
+  for node, k in zip(nodes, counts):
+    for j in range(k):
+      sets.append(node[j * len(node) // k:(j + 1) * len(node) // k])
+  return sets
+
+def pin(proc, cpus):
+  if not cpus or not proc or not hasattr(os, "sched_setaffinity"): return
+  tasks = glob.glob(f"/proc/{proc.pid}/task/*")
+  for pid in [int(os.path.basename(task)) for task in tasks] or [proc.pid]:
+    try:
+      os.sched_setaffinity(pid, cpus)
+    except: pass
+
+def read_progress(stream):
+  tail = b""
+  while True:
+    chunk = stream.read1(2**16)
+    buf = tail + chunk
+    end = len(buf) if not chunk else max(buf.rfind(b"\r"), buf.rfind(b"\n")) + 1
+    tail = buf[end:][-4096:]
+
+    matches = PROGRESS_RE.findall(buf, 0, end)
+    if matches:
+      yield int(matches[-1])
+
+    if not chunk:
+      break
+
+def fast_first_pass(encoder_params):
+  cpu_used = re.search(r"--cpu-used=(-?[0-9]+)", encoder_params)
+  if cpu_used:
+    return encoder_params.replace(cpu_used.group(0), f"--cpu-used={max(int(cpu_used.group(1)), 6)}")
+  return f"{encoder_params} --cpu-used=6"
+
 def aom_vpx_encode(encoder, encoder_path, worker, job):
   worker.job_started = time.time()
 
@@ -39,7 +190,16 @@ def aom_vpx_encode(encoder, encoder_path, worker, job):
   if encoder == "aomenc" and "vmaf" in encoder_params and len(worker.client.args.vmaf_path) > 0:
     encoder_params += f" --vmaf-model-path={worker.client.args.vmaf_path}"
 
-  vfs = [f"select=gte(n\\,{job.start})"]
+  start = int(job.start)
+  seek = []
+  vfs = []
+
+  if start > 0:
+    fps = probe_fps(worker.client.args.ffprobe, job.video)
+    if fps:
+      seek = ["-ss", f"{(start - 0.5) / fps:.6f}"]
+    else:
+      vfs.append(f"select=gte(n\\,{start})")
 
   vf_match = re.search(r"(?:-vf\s\"([^\"]+?)\"|-vf\s([^\s]+?)\s)", ffmpeg_params)
 
@@ -47,95 +207,136 @@ def aom_vpx_encode(encoder, encoder_path, worker, job):
     vfs.append(vf_match.group(1) or vf_match.group(2))
     ffmpeg_params = re.sub(r"(?:-vf\s\"([^\"]+?)\"|-vf\s([^\s]+?)\s)", "", ffmpeg_params).strip()
 
-  vf = ",".join(vfs)
-
   output_filename = f"{job.video}.ivf"
 
   ffmpeg = [
     worker.client.args.ffmpeg, "-y", "-hide_banner",
-    "-loglevel", "error",
+    "-loglevel", "error"
+  ] + seek + [
     "-i", job.video,
     "-strict", "-1",
-    "-pix_fmt", "yuv420p",
-    "-vf", vf,
-    "-vframes", job.frames
+    "-pix_fmt", "yuv420p"
   ]
 
+  if vfs:
+    ffmpeg.extend(["-vf", ",".join(vfs)])
+
+  ffmpeg.extend(["-vframes", job.frames])
+
   if ffmpeg_params:
     ffmpeg.extend(ffmpeg_params.split(" "))
 
   ffmpeg.extend(["-f", "yuv4mpegpipe", "-"])
 
-  aom = [encoder_path, "-", "--ivf", f"--fpf={job.video}.log", f"--threads={args.threads}", "--passes=2"]
+  total_frames = int(job.frames)
 
-  passes = [
-    aom + re.sub(r"--denoise-noise-level=[0-9]+", "", encoder_params).split(" ") + ["--pass=1", "-o", os.devnull],
-    aom + encoder_params.split(" ") + ["--pass=2", "-o", output_filename]
-  ]
+  if job.grain and not job.has_grain:
+    return False, None
 
-  if job.grain:
-    if not job.has_grain:
+  job.stats = {"decode": 0, "passes": []}
+
+  if job.passes == "1":
+    decoded = None
+    passes = [
+      [encoder_path, "-", "--ivf", f"--threads={worker.get_threads()}", "--passes=1"] + encoder_params.split(" ") + ["-o", output_filename]
+    ]
+  else:
+    worker.update_status(f"{encoder:.3s}", "decoding", progress=True)
+    decode_started = time.time()
+    decoded = decode_y4m(ffmpeg, f"{CACHE_PREFIX}{os.path.basename(job.video)}.y4m", total_frames, worker)
+    if worker.aborted or worker.stopped:
       return False, None
-    else:
-      passes[1].append(f"--film-grain-table={job.grain}")
+    job.stats["decode"] = round(time.time() - decode_started, 2)
 
-  total_frames = int(job.frames)
+    aom = [encoder_path, decoded or "-", "--ivf", f"--fpf={job.video}.log", f"--threads={worker.get_threads()}", "--passes=2"]
+
+    first_pass_params = re.sub(r"--denoise-noise-level=[0-9]+", "", encoder_params)
+    if job.passes == "fast":
+      first_pass_params = fast_first_pass(first_pass_params)
+
+    passes = [
+      aom + first_pass_params.split(" ") + ["--pass=1", "-o", os.devnull],
+      aom + encoder_params.split(" ") + ["--pass=2", "-o", output_filename]
+    ]
+
+  if job.grain:
+    passes[-1].append(f"--film-grain-table={job.grain}")
+
+  worker.passes = len(passes)
 
   success = True
   for pass_n, cmd in enumerate(passes, start=1):
-    ffmpeg_pipe = subprocess.Popen(ffmpeg,
-      stdout=subprocess.PIPE,
-      stderr=subprocess.STDOUT)
+    if worker.aborted or worker.stopped:
+      success = False
+      break
+
+    ffmpeg_pipe = None
+    if not decoded:
+      ffmpeg_pipe = subprocess.Popen(ffmpeg,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL)
+      pin(ffmpeg_pipe, worker.cpus)
 
+    pass_started = time.time()
     worker.pipe = subprocess.Popen(cmd,
-      stdin=ffmpeg_pipe.stdout,
+      stdin=ffmpeg_pipe.stdout if ffmpeg_pipe else None,
       stdout=subprocess.PIPE,
-      stderr=subprocess.STDOUT,
-      universal_newlines=True)
+      stderr=subprocess.STDOUT)
+    pin(worker.pipe, worker.cpus)
+    worker.ffmpeg_pipe = ffmpeg_pipe
 
     worker.progress = (pass_n, 0)
     worker.update_status(f"{encoder:.3s}", "pass:", pass_n, print_progress(0, total_frames), progress=True)
 
-    while True:
-      line = worker.pipe.stdout.readline().strip()
-
-      if len(line) == 0 and worker.pipe.poll() is not None:
-        break
-
-      match = re.search(r"frame.*?\/([^ ]+?) ", line)
-      if match:
-        frames = int(match.group(1))
-        worker.progress = (pass_n, frames)
-        if pass_n == 2:
-          worker.update_fps(frames)
-        worker.update_status(f"{encoder:.3s}", "pass:", pass_n, print_progress(frames, total_frames), progress=True)
-
-    if ffmpeg_pipe.poll() is None:
+    frames = 0
+    last_update = 0
+    for frames in read_progress(worker.pipe.stdout):
+      worker.progress = (pass_n, frames)
+      now = time.time()
+      if now - last_update < STATUS_INTERVAL: continue
+      last_update = now
+      if pass_n == len(passes):
+        worker.update_fps(frames)
+      worker.update_status(f"{encoder:.3s}", "pass:", pass_n, print_progress(frames, total_frames), progress=True)
+
+    worker.pipe.wait()
+    elapsed = time.time() - pass_started
+    job.stats["passes"].append({"pass": pass_n, "seconds": round(elapsed, 2), "frames": frames})
+    if pass_n == len(passes):
+      worker.update_fps(frames)
+
+    if ffmpeg_pipe and ffmpeg_pipe.poll() is None:
       ffmpeg_pipe.kill()
+    worker.ffmpeg_pipe = None
 
     if worker.pipe.returncode != 0:
       success = False
 
+  if decoded and os.path.isfile(decoded):
+    os.remove(decoded)
+
   if os.path.isfile(f"{job.video}.log"):
     os.remove(f"{job.video}.log")
 
   return success, output_filename
 
 class Job:
-  def __init__(self, r, video, grain=""):
-    self.id = r.headers["id"]
-    self.filename = r.headers["filename"]
-    self.projectid = r.headers["projectid"]
-    self.scene = r.headers["scene"]
-    self.encoder = r.headers["encoder"]
-    self.encoder_params = r.headers["encoder_params"]
-    self.ffmpeg_params = r.headers["ffmpeg_params"]
-    self.frames = r.headers["frames"]
-    self.start = r.headers["start"]
-    self.request = r
-    self.has_grain = int(r.headers["grain"]) if "grain" in r.headers else None
+  def __init__(self, info, video, grain=""):
+    self.id = info["id"]
+    self.filename = info["filename"]
+    self.projectid = info["projectid"]
+    self.scene = info["scene"]
+    self.encoder = info["encoder"]
+    self.encoder_params = info["encoder_params"]
+    self.ffmpeg_params = info["ffmpeg_params"]
+    self.frames = info["frames"]
+    self.start = info["start"]
+    self.passes = info["passes"] if "passes" in info else "2"
+    self.segment = info["checksum"] if "checksum" in info else None
+    self.has_grain = int(info["grain"]) if "grain" in info else None
     self.video = video
     self.grain = grain
+    self.stats = None
 
   def dispose(self):
     if self.video and os.path.exists(self.video):
@@ -155,12 +356,26 @@ class Client:
     self.args = args
     self.workers = []
     self.workers_lock = Lock()
-    self.numworkers = int(args.workers)
+    self.register_lock = Lock()
+    self.register_supported = True
+    self.nodes = cpu_nodes()
+    self.auto_threads = args.threads == "auto"
+    self.pinned = args.workers == "auto" or self.auto_threads
+    if args.workers == "auto":
+      threads = auto_threads(self.nodes) if self.auto_threads else max(int(args.threads), 1)
+      self.numworkers = max(sum(len(node) // threads for node in self.nodes), 1)
+    else:
+      self.numworkers = int(args.workers)
     self.completed = 0
     self.failed = 0
     self.session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.numworkers + int(args.upload_workers) + 8)
+    self.session.mount("http://", adapter)
+    self.session.mount("https://", adapter)
     self.scr = None
     self.render_lock = RLock()
+    self.repaint = False
+    self.refresh_rate = max(float(args.refresh_rate), 0.1)
     
     self.menu = type("", (), {})
     self.menu.selected_item = 0
@@ -182,11 +397,18 @@ class Client:
     }
 
     self.upload_queue = deque()
-    self.upload_queue_event = Event()
-    self.uploading = None
-    Thread(target=self._upload_loop, daemon=True).start()
-
-    self.job_queue_size = int(args.queue)
+    self.upload_queue_not_empty = Condition()
+    self.uploading = []
+    self.upload_rate = 0
+    for i in range(max(int(args.upload_workers), 1)):
+      Thread(target=self._upload_loop, daemon=True).start()
+
+    self.adaptive_queue = args.queue == "auto"
+    self.job_queue_size = 1 if self.adaptive_queue else int(args.queue)
+    self.download_rate = 0
+    self.segment_bytes = 0
+    self.segment_frames = 0
+    self.remaining = None
     self.job_queue = deque()
     self.job_queue_lock = Lock()
     self.job_queue_not_empty = Condition(self.job_queue_lock)
@@ -198,31 +420,107 @@ class Client:
     self.download_event = Event()
     
     self.download_executor = ThreadPoolExecutor(max_workers=1)
+    self.segment_executor = ThreadPoolExecutor(max_workers=4)
+    self.downloading = []
 
+    self.register()
     Thread(target=self._download_loop, daemon=True).start()
 
+    self.heartbeat_interval = 30
+    Thread(target=self._heartbeat_loop, daemon=True).start()
+
   def _update_download_status(self, *argv, progress=False):
     self.download_status = " ".join([str(arg) for arg in argv])
     self.refresh_screen()
 
+  def _update_queue_size(self):
+    fps = sum(worker.fps for worker in self.workers)
+    if fps and self.download_rate and self.segment_frames:
+      segments_per_second = fps / self.segment_frames
+      download_time = self.segment_bytes / self.download_rate
+      size = math.ceil(segments_per_second * download_time) + 1
+    else:
+      size = self.job_queue_size
+
+    size = min(size, max(len(self.workers), 1))
+
+    if self.remaining is not None and self.remaining <= len(self.workers):
+      size = 1
+
+    self.job_queue_size = max(size, 1)
+
   def _download_loop(self):
     while True:
+      if self.adaptive_queue:
+        self._update_queue_size()
+
       if len(self.job_queue) < self.job_queue_size:
-        with self.job_queue_ret_lock:
-          job = self.download_job(self._update_download_status)
-          if job:
-            self._add_job_to_queue(job)
-            self.refresh_screen()
+        self.download_jobs(self.job_queue_size - len(self.job_queue), self._update_download_status)
       else:
         self.download_status = ""
         self.download_event.wait()
         self.download_event.clear()
       if self.stopping: return
 
+  def _heartbeat_loop(self):
+    while not self.stopping:
+      time.sleep(self.heartbeat_interval)
+
+      try:
+        jobs = []
+        for worker in list(self.workers):
+          job = worker.job
+          if job is not None:
+            jobs.append((job, worker.get_progress()))
+
+        with self.job_queue_lock:
+          jobs.extend([(job, 0) for job in self.job_queue])
+
+        with self.upload_queue_not_empty:
+          jobs.extend([(up[0], 1) for up in self.upload_queue])
+          jobs.extend([(job, 1) for job in self.uploading])
+
+        r = self.session.post(f"{self.args.target}/api/heartbeat", json={
+          "jobs": [{"projectid": job.projectid, "scene": job.scene, "id": job.id, "progress": progress} for job, progress in jobs]
+        }, timeout=10)
+        if r.status_code != 200: continue
+        result = r.json()
+      except:
+        continue
+
+      self.heartbeat_interval = max(min(result["lease"] / 4, 30), 1)
+      done = {(job["projectid"], job["scene"]) for job in result["done"]}
+      if not done: continue
+
+      for worker in self.workers:
+        if worker.job and (worker.job.projectid, worker.job.scene) in done:
+          worker.abort()
+
+      with self.job_queue_not_empty:
+        for job in [job for job in self.job_queue if (job.projectid, job.scene) in done]:
+          self.job_queue.remove(job)
+          job.dispose()
+          self.download_event.set()
+
+      with self.upload_queue_not_empty:
+        dropped = [up for up in self.upload_queue if (up[0].projectid, up[0].scene) in done]
+        for up in dropped:
+          self.upload_queue.remove(up)
+
+      for job, output in dropped:
+        if os.path.exists(output):
+          try:
+            os.remove(output)
+          except: pass
+
+      if dropped:
+        self.refresh_screen()
+
   def _add_job_to_queue(self, job):
     with self.job_queue_not_empty:
       self.job_queue.append(job)
       self.job_queue_not_empty.notify()
+    self.refresh_screen()
 
   def download_job(self, update_status, worker=None):
     job = self.fetch_new_job(update_status, worker)
@@ -230,12 +528,19 @@ class Client:
       if worker:
         worker.job = job
       return job
+    self._wait_retry(update_status, worker)
+    return None
+
+  def download_jobs(self, count, update_status):
+    if self.fetch_new_jobs(count, update_status, self._add_job_to_queue) == 0:
+      self._wait_retry(update_status)
+
+  def _wait_retry(self, update_status, worker=None):
     for i in range(15):
-      if self.stopping or worker and worker.stopped: return None
+      if self.stopping or worker and worker.stopped: return
       update_status(f"waiting...{15-i:2d}")
       self.download_timer.wait(1)
       self.download_timer.clear()
-    return None
 
   def download(self, stream, suffix, cb, worker=None):
     file = ""
@@ -260,6 +565,69 @@ class Client:
         os.remove(file.name)
       return None
 
+  def download_segment(self, info, cb, worker=None, r=None):
+    url = f"{self.args.target}/api/get_segment/{info['projectid']}/{info['scene']}"
+    path = f"{info['projectid']}_{info['scene']}_{info['filename']}"
+    path_part = f"{CACHE_PREFIX}{path}.part"
+    checksum = None
+
+    for attempt in range(5):
+      if self.stopping or (worker and worker.stopped): return None
+      try:
+        offset = os.path.getsize(path_part) if os.path.isfile(path_part) else 0
+        started = time.time()
+
+        if r is None:
+          headers = {}
+          if offset > 0:
+            headers["Range"] = f"bytes={offset}-"
+            if checksum:
+              headers["If-Range"] = f"\"{checksum}\""
+
+          r = self.session.get(url, headers=headers, timeout=3, stream=True)
+          if r.status_code == 416:
+            os.remove(path_part)
+            r = None
+            continue
+
+          if r.status_code not in (200, 206):
+            return None
+
+        checksum = r.headers["checksum"] if "checksum" in r.headers else checksum
+        if r.status_code != 206:
+          offset = 0
+
+        downloaded = offset
+        total_size = offset + int(r.headers["content-length"])
+        with open(path_part, "ab" if offset > 0 else "wb") as file:
+          for chunk in r.iter_content(chunk_size=2**16):
+            if self.stopping or (worker and worker.stopped):
+              return None
+            if chunk:
+              downloaded += len(chunk)
+              cb("downloading", print_progress_bytes(downloaded, total_size), progress=True)
+              file.write(chunk)
+        r = None
+
+        if downloaded != total_size or (checksum and file_checksum(path_part) != checksum):
+          os.remove(path_part)
+          continue
+
+        os.replace(path_part, path)
+        info["checksum"] = checksum
+
+        rate = (downloaded - offset) / max(time.time() - started, 0.001)
+        self.download_rate = rate if not self.download_rate else self.download_rate * 0.7 + rate * 0.3
+        self.segment_bytes = total_size if not self.segment_bytes else self.segment_bytes * 0.7 + total_size * 0.3
+        frames = int(info["frames"])
+        self.segment_frames = frames if not self.segment_frames else self.segment_frames * 0.7 + frames * 0.3
+        return path
+      except:
+        r = None
+        time.sleep(min(2 ** attempt, 10))
+
+    return None
+
   def get_job(self, worker, update_status):
     if self.job_queue_size > 0:
       with self.job_queue_ret_lock:
@@ -286,37 +654,36 @@ class Client:
 
   def _upload_loop(self):
     while True:
-      if len(self.upload_queue) == 0:
-        self.upload_queue_event.wait()
+      with self.upload_queue_not_empty:
+        while len(self.upload_queue) == 0:
+          self.upload_queue_not_empty.wait()
 
-      self.upload_queue_event.clear()
+        job, output = self.upload_queue.popleft()
+        self.uploading.append(job)
       
       try:
-        job, output = self.upload_queue.popleft()
-        self.uploading = job
-
         uploads = 3
         fails = 0
         while uploads > 0 and fails < 10:
-          r = self._upload(job, output)
+          result = self._upload(job, output)
           
-          if r:
-            if r.text == "saved":
+          if result:
+            if result == "saved":
               self.completed += 1
-              break
-            elif r.text == "bad upload":
+            elif result == "bad upload":
               if self.args.noui:
                 print("bad upload", "retrying", job.projectid, job.scene)
               uploads -= 1
-            else:
-              if self.args.noui:
-                print("failed", r.status_code, r.text, job.projectid, job.scene)
-              fails += 1
-          else:
-            if self.args.noui:
-              print("unable to connect, trying again")
-            fails += 1
-          time.sleep(1)
+              time.sleep(1)
+              continue
+            elif self.args.noui:
+              print("discarded", result, job.projectid, job.scene)
+            break
+
+          if self.args.noui:
+            print("unable to connect, trying again")
+          fails += 1
+          time.sleep(min(2 ** fails, 60))
 
         if fails >= 10:
           self.failed += 1
@@ -327,36 +694,106 @@ class Client:
           except: pass
       except: pass
 
-      self.uploading = None
+      with self.upload_queue_not_empty:
+        self.uploading.remove(job)
       self.refresh_screen()
 
   def upload(self, job, output):
-    self.upload_queue.append((job, output))
-    self.upload_queue_event.set()
+    with self.upload_queue_not_empty:
+      self.upload_queue.append((job, output))
+      self.upload_queue_not_empty.notify()
     self.refresh_screen()
 
   def _upload(self, job, output):
     try:
+      if self.args.noui:
+        print("uploading to", f"{self.args.target}/api/upload")
+      r = self.session.post(
+        f"{self.args.target}/api/upload",
+        json={
+          "client": job.id,
+          "scene": job.scene,
+          "projectid": job.projectid,
+          "encoder": job.encoder,
+          "version": encoder_versions[job.encoder],
+          "encoder_params": job.encoder_params,
+          "ffmpeg_params": job.ffmpeg_params,
+          "grain": int(len(job.grain) > 0),
+          "passes": job.passes,
+          "stats": job.stats,
+          "segment": job.segment
+        },
+        timeout=10)
+
+      if r.status_code >= 500:
+        return None
+
+      if r.status_code != 200:
+        return r.text
+
+      try:
+        upload = r.json()
+      except ValueError:
+        return r.text
+
+      if "result" in upload:
+        return upload["result"]
+
+      url = f"{self.args.target}/api/upload/{upload['upload']}"
+      offset = upload["offset"]
+      size = os.path.getsize(output)
+      fails = 0
+      started = time.time()
+
       with open(output, "rb") as file:
-        files = [("file", (os.path.splitext(job.filename)[0] + os.path.splitext(output)[1], file, "application/octet"))]
-        if self.args.noui:
-          print("uploading to", f"{self.args.target}/finish_job")
-        return self.session.post(
-          f"{self.args.target}/finish_job",
-          data={
-            "client": job.id,
-            "scene": job.scene,
-            "projectid": job.projectid,
-            "encoder": job.encoder,
-            "version": encoder_versions[job.encoder],
-            "encoder_params": job.encoder_params,
-            "ffmpeg_params": job.ffmpeg_params,
-            "grain": int(len(job.grain) > 0)
-          },
-          files=files)
+        while offset < size:
+          try:
+            file.seek(offset)
+            r = self.session.put(url, params={"offset": offset}, data=file.read(upload["chunk"]), timeout=60)
+            if r.status_code == 404:
+              return None
+            offset = r.json()["offset"]
+          except:
+            fails += 1
+            if fails >= 10:
+              return None
+            time.sleep(min(2 ** fails, 30))
+            try:
+              offset = self.session.get(url, timeout=10).json()["offset"]
+            except: pass
+
+      rate = (size - upload["offset"]) / max(time.time() - started, 0.001)
+      self.upload_rate = rate if not self.upload_rate else self.upload_rate * 0.7 + rate * 0.3
+
+      r = self.session.post(f"{url}/finish", json={"sha256": file_checksum(output)}, timeout=30)
+      if r.status_code >= 500:
+        return None
+
+      if r.status_code != 200:
+        return r.text
+
+      result = r.json()
+      if not result["ticket"]:
+        return result["result"]
+
+      return self._wait_ticket(result["ticket"])
     except:
       return None
 
+  def _wait_ticket(self, ticket):
+    fails = 0
+    while fails < 10:
+      try:
+        r = self.session.get(f"{self.args.target}/api/get_ticket/{ticket}", params={"wait": 1}, timeout=10)
+        if r.status_code >= 500:
+          fails += 1
+        elif r.status_code != 200 or r.text != "pending":
+          return r.text
+      except:
+        fails += 1
+      time.sleep(2)
+    return None
+
   def fetch_grain_table(self, projectid, scene):
     for i in range(3):
       try:
@@ -366,60 +803,148 @@ class Client:
       except: pass
     return None
 
-  def fetch_new_job(self, cb, worker=None):
+  def _skip_jobs(self):
     jobs = [worker.job for worker in self.workers if worker.job is not None]
     jobs.extend(self.job_queue)
     jobs.extend([up[0] for up in self.upload_queue])
-    if self.uploading:
-      jobs.append(self.uploading)
+    jobs.extend(self.uploading)
 
     jobs = [{"projectid": job.projectid, "scene": job.scene} for job in jobs]
+    jobs.extend([{"projectid": info["projectid"], "scene": info["scene"]} for info in self.downloading])
+    return jobs
+
+  def register(self):
+    with self.register_lock:
+      try:
+        r = self.session.post(
+          f"{self.args.target}/api/register",
+          json={
+            "versions": self.encoder_versions,
+            "modes": ["1", "2", "fast"],
+            "cpus": sum(len(node) for node in self.nodes),
+            "workers": self.numworkers
+          },
+          timeout=3)
+        if r.status_code == 404:
+          self.register_supported = False
+        if r.status_code != 200:
+          return False
+        result = r.json()
+      except:
+        return False
 
-    jobs_str = json.dumps(jobs)
+      self.session.headers["X-Session"] = result["session"]
+
+      for encoder in ["aom", "vpx"]:
+        if encoder not in result["encoders"] and os.path.isfile(f"{encoder}enc.exe"):
+          self._bad_version(encoder, result["versions"][encoder])
+
+      if not result["encoders"]:
+        self._bad_version("aom", result["versions"]["aom"])
+
+      return True
+
+  def _ensure_registered(self):
+    if self.register_supported and "X-Session" not in self.session.headers:
+      self.register()
+
+  def _registered(self, r):
+    if r.status_code != 401:
+      return True
+    self.session.headers.pop("X-Session", None)
+    self.register()
+    return False
+
+  def _check_version(self, info):
+    encoder = info["encoder"]
+    if self.encoder_versions[encoder] == info["version"]:
+      return True
+
+    self._cancel_job(info["id"], info["scene"], info["projectid"])
+    self._bad_version(encoder, info["version"])
+    return False
+
+  def _bad_version(self, encoder, required):
+    message = f"bad {encoder} version. have: {self.encoder_versions[encoder]} required: {required}"
+    if os.path.isfile(f"{encoder}enc.exe"):
+      self.config["r"] = len(self.workers)
+      save_config(self.config)
+      os.remove(f"{encoder}enc.exe")
+      self.stop(f"{message}\n\nRestart to re-download.")
+    else:
+      self.stop(message)
+
+  def _with_grain(self, info, video_file, cb, worker=None):
+    if "grain" in info and int(info["grain"]):
+      grain_r = self.session.get(f"{self.args.target}/api/get_grain/{info['projectid']}/{info['scene']}", timeout=3, stream=True)
+      if grain_r and grain_r.status_code == 200:
+        grain_file = self.download(grain_r, info["filename"] + ".table", cb, worker)
+        if grain_file:
+          return Job(info, video_file, grain_file)
+      try:
+        os.remove(video_file)
+      except: pass
+      return None
+
+    return Job(info, video_file)
+
+  def fetch_new_job(self, cb, worker=None):
+    self._ensure_registered()
+    jobs_str = json.dumps(self._skip_jobs())
     try:
       r = self.session.get(f"{self.args.target}/api/get_job/{jobs_str}", timeout=3, stream=True)
-      if r.status_code != 200:
+      if not self._registered(r) or r.status_code != 200:
         return None
 
-      encoder = r.headers["encoder"]
-      if self.encoder_versions[encoder] != r.headers["version"]:
-        self._cancel_job(r.headers["id"], r.headers["projectid"], r.headers["scene"])
-        if encoder == "aom":
-          if os.path.isfile("aomenc.exe"):
-            self.config["r"] = len(self.workers)
-            save_config(self.config)
-            os.remove("aomenc.exe")
-            self.stop(f"bad aom version. have: {encoder_versions[encoder]} required: {r.headers['version']}\n\nRestart to re-download.")
-          else:
-            self.stop(f"bad aom version. have: {encoder_versions[encoder]} required: {r.headers['version']}")
-
-        if encoder == "vpx":
-          if os.path.isfile("vpxenc.exe"):
-            self.config["r"] = len(self.workers)
-            save_config(self.config)
-            os.remove("vpxenc.exe")
-            self.stop(f"bad vpx version. have: {encoder_versions[encoder]} required: {r.headers['version']}\n\nRestart to re-download.")
-          else:
-            self.stop(f"bad vpx version. have: {encoder_versions[encoder]} required: {r.headers['version']}")
-
+      if not self._check_version(r.headers):
         return None
 
-      video_file = self.download(r, r.headers["filename"], cb, worker)
+      video_file = self.download_segment(r.headers, cb, worker, r)
       if not video_file:
         return None
 
-      if "grain" in r.headers and int(r.headers["grain"]):
-        grain_r = self.session.get(f"{self.args.target}/api/get_grain/{r.headers['projectid']}/{r.headers['scene']}", timeout=3, stream=True)
-        if grain_r and grain_r.status_code == 200:
-          grain_file = self.download(grain_r, r.headers["filename"] + ".table", cb, worker)
-          if grain_file:
-            return Job(r, video_file, grain_file)
-        try:
-          os.remove(video_file)
-        except: pass
+      return self._with_grain(r.headers, video_file, cb, worker)
+    except:
+      return None
+
+  def fetch_new_jobs(self, count, cb, on_job):
+    self._ensure_registered()
+    with self.job_queue_ret_lock:
+      try:
+        r = self.session.post(f"{self.args.target}/api/lease_jobs", json={"count": count, "jobs": self._skip_jobs()}, timeout=3)
+        if not self._registered(r) or r.status_code != 200:
+          return 0
+        result = r.json()
+        infos = result["jobs"]
+        self.remaining = result["remaining"] if "remaining" in result else None
+      except:
+        return 0
+
+      infos = [info for info in infos if self._check_version(info)]
+      self.downloading.extend(infos)
+
+    futures = {self.segment_executor.submit(self.fetch_segment, info, cb): info for info in infos}
+
+    fetched = 0
+    for future in as_completed(futures):
+      info = futures[future]
+      job = future.result()
+      if job:
+        on_job(job)
+        fetched += 1
+      else:
+        self._cancel_job(info["id"], info["scene"], info["projectid"])
+      self.downloading.remove(info)
+
+    return fetched
+
+  def fetch_segment(self, info, cb):
+    try:
+      video_file = self.download_segment(info, cb)
+      if not video_file:
         return None
 
-      return Job(r, video_file)
+      return self._with_grain(info, video_file, cb)
     except:
       return None
 
@@ -447,7 +972,10 @@ class Client:
       with self.job_queue_not_empty:
         self.job_queue_not_empty.notify_all()
     
-    for job in self.job_queue:
+    with self.job_queue_lock:
+      queued = list(self.job_queue)
+
+    for job in queued:
       self.cancel_job(job)
       job.dispose()
 
@@ -457,55 +985,123 @@ class Client:
   def add_worker(self, worker):
     if self.stopping: return
     self.workers.append(worker)
+    self.rebalance()
     worker.start()
 
   def remove_worker(self, worker):
     if worker in self.workers:
       self.workers.remove(worker)
+      self.rebalance()
       self.refresh_screen()
 
+  def rebalance(self):
+    if not self.pinned: return
+    workers = [worker for worker in self.workers if not worker.stopped]
+    for worker, cpus in zip(workers, partition_cpus(self.nodes, len(workers))):
+      worker.cpus = cpus
+      pin(worker.pipe, cpus)
+      pin(worker.ffmpeg_pipe, cpus)
+
+  def status(self):
+    workers = list(self.workers)
+    worker_status = []
+    for worker in workers:
+      job = worker.job
+      worker_status.append({
+        "status": worker.status,
+        "fps": round(worker.fps, 2),
+        "progress": round(worker.get_progress(), 3),
+        "projectid": job.projectid if job else None,
+        "scene": job.scene if job else None,
+        "cpus": worker.cpus
+      })
+
+    return {
+      "target": self.args.target,
+      "workers": self.numworkers,
+      "active": len([worker for worker in workers if worker.pipe]),
+      "uploading": len(self.upload_queue) + len(self.uploading),
+      "upload_rate": round(self.upload_rate),
+      "completed": self.completed,
+      "failed": self.failed,
+      "fps": round(sum(worker.fps for worker in workers), 2),
+      "queue": len(self.job_queue),
+      "queue_size": self.job_queue_size,
+      "download_status": self.download_status,
+      "worker_status": worker_status
+    }
+
+  def serve_status(self, port):
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    client = self
+
+    class StatusHandler(BaseHTTPRequestHandler):
+      def do_GET(self):
+        body = json.dumps(client.status()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, *args): pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), StatusHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
   def screen(self):
+    rows = {}
+    size = None
+    header_key = None
+    header = []
+
     while self.refresh.wait():
       if not self.scr: continue
-      self.render_lock.acquire()
-      msg = []
-      for i, worker in enumerate(self.workers, start=1):
-        msg.append(f"{i:2} {worker.status}")
+      frame_started = time.time()
+      self.refresh.clear()
 
-      n_active = len([worker for worker in self.workers if worker.pipe])
-      n_uploading = len(self.upload_queue) + 1 if self.uploading else 0
-      footer = " ".join([f"[{item}]" if i == self.menu.selected_item else f" {item} " for i, item in enumerate(self.menu.items)])
+      with self.render_lock:
+        status = self.status()
+        (mlines, mcols) = self.scr.getmaxyx()
 
-      cfps = round(sum(worker.fps for worker in self.workers), 2)
-      self.scr.erase()
+        if size != (mlines, mcols) or self.repaint:
+          self.scr.erase()
+          rows = {}
+          size = (mlines, mcols)
+          self.repaint = False
 
-      (mlines, mcols) = self.scr.getmaxyx()
+        header_text = (f"workers: {status['workers']} active: {status['active']} uploading: {status['uploading']} "
+          f"up: {bytes_str(status['upload_rate'])}/s hit: {status['completed']} miss: {status['failed']} cfps: {status['fps']}")
+        if header_key != (header_text, mcols):
+          header_key = (header_text, mcols)
+          header = textwrap.wrap(header_text, width=mcols)
 
-      header = []
-      for line in textwrap.wrap(f"workers: {self.numworkers} active: {n_active} uploading: {n_uploading} "
-        f"hit: {self.completed} miss: {self.failed} cfps: {cfps}", width=mcols):
-        header.append(line)
+        lines = [(line, curses.color_pair(1)) for line in header]
 
-      body_y = len(header)
-      window_size = mlines - body_y - 1 - (1 if self.job_queue_size > 0 else 0)
-      self.menu.scroll = max(min(self.menu.scroll, len(self.workers) - window_size), 0)
+        if self.job_queue_size > 0:
+          lines.append((f"queue: {status['queue']}/{self.job_queue_size} {status['download_status']}", 0))
 
-      for i, line in enumerate(header):
-        self.scr.insstr(i, 0, line.ljust(mcols), curses.color_pair(1))
+        window_size = mlines - len(lines) - 1
+        self.menu.scroll = max(min(self.menu.scroll, len(status["worker_status"]) - window_size), 0)
 
-      if self.job_queue_size > 0:
-        self.scr.insstr(body_y, 0, f"queue: {len(self.job_queue)} {self.download_status}")
-        body_y += 1
+        for i, worker in enumerate(status["worker_status"][self.menu.scroll:window_size + self.menu.scroll], start=self.menu.scroll + 1):
+          lines.append((f"{i:2} {worker['status']}", 0))
 
-      for i, line in enumerate(msg[self.menu.scroll:window_size + self.menu.scroll], start=body_y):
-        self.scr.insstr(i, 0, line)
+        lines.extend([("", 0)] * (mlines - 1 - len(lines)))
 
-      pad = " " * (mcols - len(footer) - len(self.args.target) - 1)
-      self.scr.insstr(mlines - 1, 0, f"{footer}{pad}{self.args.target}"[:mcols].ljust(mcols) , curses.color_pair(1))
-      
-      self.scr.refresh()
-      self.refresh.clear()
-      self.render_lock.release()
+        footer = " ".join([f"[{item}]" if i == self.menu.selected_item else f" {item} " for i, item in enumerate(self.menu.items)])
+        pad = " " * (mcols - len(footer) - len(self.args.target) - 1)
+        lines.append((f"{footer}{pad}{self.args.target}", curses.color_pair(1)))
+
+        for y, line in enumerate(lines[:mlines]):
+          if rows.get(y) == line: continue
+          rows[y] = line
+          self.scr.insstr(y, 0, line[0][:mcols].ljust(mcols), line[1])
+
+        self.scr.refresh()
+
+      time.sleep(max(1 / self.refresh_rate - (time.time() - frame_started), 0))
 
   def refresh_screen(self):
     self.refresh.set()
@@ -565,6 +1161,7 @@ class Client:
         with self.render_lock:
           self.scr.clear()
           self.scr.refresh()
+          self.repaint = True
 
       self.refresh_screen()
   
@@ -596,8 +1193,12 @@ class Worker:
     self.thread = None
     self.job = None
     self.pipe = None
+    self.ffmpeg_pipe = None
+    self.cpus = None
     self.stopped = False
     self.progress = (0, 0)
+    self.passes = 2
+    self.aborted = False
     self.id = 0
 
     self.job_started = 0
@@ -618,6 +1219,23 @@ class Worker:
       self.client.cancel_job(self.job)
       self.job.dispose()
 
+  def abort(self):
+    self.aborted = True
+
+    if self.pipe and self.pipe.poll() is None:
+      self.pipe.kill()
+
+  def get_threads(self):
+    if self.client.auto_threads:
+      return len(self.cpus) if self.cpus else auto_threads(self.client.nodes)
+    return self.client.args.threads
+
+  def get_progress(self):
+    pass_n, frames = self.progress
+    job = self.job
+    if not job or pass_n == 0: return 0
+    return ((pass_n - 1) + frames / max(int(job.frames), 1)) / self.passes
+
   def start(self):
     self.thread = Thread(target=lambda: self.work(), daemon=True)
     self.thread.start()
@@ -675,6 +1293,8 @@ class Worker:
           continue
 
       try:
+        self.aborted = False
+        self.progress = (0, 0)
         success, output = self.client.encode[self.job.encoder](self, self.job)
         if self.pipe and self.pipe.poll() is None:
           self.pipe.kill()
@@ -685,11 +1305,13 @@ class Worker:
           self.client.upload(self.job, output)
           self.job.dispose()
           self.job = None
-        elif output:
-          if os.path.exists(output):
+        else:
+          if output and os.path.exists(output):
             try:
               os.remove(output)
             except: pass
+          self.job.dispose()
+          self.job = None
       except: pass
 
     self.client.remove_worker(self)
@@ -701,24 +1323,49 @@ windows_binaries = [
   ("vpxenc.exe", "https://www.sfu.ca/~ssleong/vpxenc.exe", "binary")
 ]
 
-def get_aomenc_version():
-  if not shutil.which(args.aomenc):
-    print("aomenc not found, exiting in 3s")
+def cached_version(binary, probe, cache_path="versions"):
+  path = shutil.which(binary)
+  if not path:
+    print(binary, "not found, exiting in 3s")
     time.sleep(3)
     exit()
-  p = subprocess.run([args.aomenc, "--help"], stdout=subprocess.PIPE)
+
+  path = os.path.realpath(path)
+  stat = os.stat(path)
+
+  try:
+    cache = json.load(open(cache_path, "r"))
+  except:
+    cache = {}
+
+  entry = cache.get(path)
+  if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+    return entry["version"]
+
+  version = probe(path)
+  cache[path] = {"mtime": stat.st_mtime, "size": stat.st_size, "version": version}
+  try:
+    json.dump(cache, open(cache_path, "w+"))
+  except: pass
+
+  return version
+
+def probe_aomenc(path):
+  p = subprocess.run([path, "--help"], stdout=subprocess.PIPE)
   r = re.search(r"av1\s+-\s+(.+)\n", p.stdout.decode("utf-8"))
   return r.group(1).replace("(default)", "").strip()
 
-def get_vpxenc_version():
-  if not shutil.which("vpxenc"):
-    print("vpxenc not found, exiting in 3s")
-    time.sleep(3)
-    exit()
-  p = subprocess.run(["vpxenc", "--help"], stdout=subprocess.PIPE)
+def probe_vpxenc(path):
+  p = subprocess.run([path, "--help"], stdout=subprocess.PIPE)
   r = re.search(r"vp9\s+-\s+(.+)\n", p.stdout.decode("utf-8"))
   return r.group(1).replace("(default)", "").strip()
 
+def get_aomenc_version():
+  return cached_version(args.aomenc, probe_aomenc)
+
+def get_vpxenc_version():
+  return cached_version(args.vpxenc, probe_vpxenc)
+
 def save_config(config):
   json.dump(config, open("config", "w+"))
 
@@ -728,13 +1375,17 @@ if __name__ == "__main__":
   parser = argparse.ArgumentParser()
   parser.add_argument("target", type=str, nargs="?", default="http://localhost:7899")
   parser.add_argument("--vmaf-model-path", dest="vmaf_path", default="vmaf_v0.6.1.pkl" if os.name == "nt" else "")
-  parser.add_argument("--workers", dest="workers", default=1)
-  parser.add_argument("--threads", dest="threads", default=8)
+  parser.add_argument("--workers", dest="workers", default=1, help="number of workers, or auto")
+  parser.add_argument("--threads", dest="threads", default=8, help="encoder threads per worker, or auto")
   parser.add_argument("--noui", action="store_const", const=True)
   parser.add_argument("--aomenc", default="aomenc", help="path to aomenc")
   parser.add_argument("--vpxenc", default="vpxenc", help="path to vpxenc")
   parser.add_argument("--ffmpeg", default="ffmpeg", help="path to ffmpeg")
-  parser.add_argument("--queue", default=0)
+  parser.add_argument("--ffprobe", default="ffprobe", help="path to ffprobe")
+  parser.add_argument("--queue", default=0, help="number of segments to prefetch, or auto")
+  parser.add_argument("--upload-workers", dest="upload_workers", default=1, help="number of concurrent uploads")
+  parser.add_argument("--refresh-rate", dest="refresh_rate", default=10, help="maximum screen redraws per second")
+  parser.add_argument("--status-port", dest="status_port", default=0, help="serve client status as json on this local port")
 
   args = parser.parse_args()
 
@@ -766,6 +1417,19 @@ if __name__ == "__main__":
 
   encoder_versions = {"aom": get_aomenc_version(), "vpx": get_vpxenc_version()}
 
+  for part in [f for f in os.listdir(".") if f.startswith(CACHE_PREFIX) and f.endswith(".part")]:
+    if time.time() - os.path.getmtime(part) > 86400:
+      try:
+        os.remove(part)
+      except: pass
+
+  for cache_dir in decode_cache_dirs():
+    for y4m in [os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.startswith(CACHE_PREFIX) and f.endswith(".y4m")]:
+      if time.time() - os.path.getmtime(y4m) > 86400:
+        try:
+          os.remove(y4m)
+        except: pass
+
   if os.path.exists("config"):
     try:
       config = json.load(open("config", "r"))
@@ -781,11 +1445,14 @@ if __name__ == "__main__":
     del config["r"]
     save_config(config)
   else:
-    n_workers = args.workers
+    n_workers = client.numworkers
 
   for i in range(0, int(n_workers)):
     client.add_worker(Worker(client))
 
+  if int(args.status_port):
+    client.serve_status(int(args.status_port))
+
   if args.noui:
     for worker in client.workers:
       worker.thread.join()
@@ -0,0 +1,93 @@
+import os, time, itertools, logging, traceback
+from collections import deque
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+class ActionExecutor:
+  def __init__(self, workers=None, on_done=None, on_change=None):
+    self.workers = workers or max((os.cpu_count() or 1) // 2, 2)
+    self.executor = ThreadPoolExecutor(max_workers=self.workers)
+    self.on_done = on_done
+    self.on_change = on_change
+    self.queues = {}
+    self.running = {}
+    self.counter = itertools.count(1)
+    self.lock = Lock()
+
+  def __len__(self):
+    with self.lock:
+      return sum(len(queue) for queue in self.queues.values())
+
+  def submit(self, key, fn, name="", cancellable=True):
+    action = {"id": next(self.counter), "name": name, "fn": fn, "queued": time.time(), "cancellable": cancellable}
+
+    with self.lock:
+      self.queues.setdefault(key, deque()).append(action)
+      start = key not in self.running
+      if start:
+        self.running[key] = None
+
+    if start:
+      self.executor.submit(self._drain, key)
+
+    self._changed()
+    return action["id"]
+
+  def _drain(self, key):
+    while True:
+      with self.lock:
+        queue = self.queues.get(key)
+        if not queue:
+          self.queues.pop(key, None)
+          del self.running[key]
+          break
+        action = queue.popleft()
+        action["started"] = time.time()
+        self.running[key] = action
+
+      self._changed()
+
+      try:
+        action["fn"]()
+      except:
+        logging.error(key, "action", action["name"], "failed", traceback.format_exc())
+
+      if self.on_done:
+        try:
+          self.on_done()
+        except:
+          logging.error(key, "saving after", action["name"], "failed", traceback.format_exc())
+
+    self._changed()
+
+  def _changed(self):
+    if self.on_change:
+      self.on_change()
+
+  def cancel(self, key, action_id=None, force=False):
+    with self.lock:
+      queue = self.queues.get(key)
+      if not queue:
+        return 0
+
+      kept = deque(action for action in queue if (not force and not action["cancellable"]) or (action_id is not None and action["id"] != action_id))
+      cancelled = len(queue) - len(kept)
+      self.queues[key] = kept
+
+    self._changed()
+    return cancelled
+
+  def status(self, key=None):
+    now = time.time()
+    rtn = {}
+
+    with self.lock:
+      for k in set(self.queues) | set(self.running):
+        if key is not None and k != key: continue
+        running = self.running.get(k)
+        rtn[k] = {
+          "running": {"id": running["id"], "name": running["name"], "elapsed": round(now - running["started"], 2)} if running else None,
+          "queued": [{"id": action["id"], "name": action["name"]} for action in self.queues.get(k, [])]
+        }
+
+    return rtn
@@ -0,0 +1,105 @@
+import struct
+
+HEADER = struct.Struct("<4sHH4sHHIII4x")
+FRAME = struct.Struct("<IQ")
+PTS = struct.Struct("<Q")
+FRAME_COUNT_OFFSET = 24
+
+class IvfError(Exception):
+  pass
+
+def read_header(f):
+  data = f.read(HEADER.size)
+  if len(data) != HEADER.size:
+    raise IvfError("short header")
+
+  signature, version, size, fourcc, width, height, rate, scale, frames = HEADER.unpack(data)
+  if signature != b"DKIF":
+    raise IvfError("not an ivf file")
+
+  f.seek(size)
+  return {"fourcc": fourcc, "width": width, "height": height, "rate": rate, "scale": scale, "frames": frames, "size": size}
+
+def read_segment(path):
+  with open(path, "rb") as f:
+    header = read_header(f)
+    data = bytearray(f.read())
+
+  offsets = []
+  pts = []
+  pos = 0
+  while pos < len(data):
+    if pos + FRAME.size > len(data):
+      raise IvfError("truncated frame header")
+    size, frame_pts = FRAME.unpack_from(data, pos)
+    if pos + FRAME.size + size > len(data):
+      raise IvfError("truncated frame")
+    offsets.append(pos)
+    pts.append(frame_pts)
+    pos += FRAME.size + size
+
+  return header, data, offsets, pts
+
+class IvfWriter:
+  def __init__(self, path, frames=0, pts=0, size=0):
+    self.path = path
+    self.frames = frames
+    self.pts = pts
+    self.size = size
+    self.header = None
+    self.file = None
+
+  def state(self):
+    return {"frames": self.frames, "pts": self.pts, "size": self.size}
+
+  def _open(self, header):
+    if self.file: return
+
+    if self.size == 0:
+      self.file = open(self.path, "w+b")
+      self.file.write(HEADER.pack(b"DKIF", 0, HEADER.size, header["fourcc"], header["width"], header["height"], header["rate"], header["scale"], 0))
+      self.header = dict(header, size=HEADER.size, frames=0)
+      self.size = HEADER.size
+    else:
+      self.file = open(self.path, "r+b")
+      self.header = read_header(self.file)
+
+  def append(self, path):
+    header, data, offsets, pts = read_segment(path)
+    self._open(header)
+
+    for key in ["fourcc", "width", "height"]:
+      if header[key] != self.header[key]:
+        raise IvfError(f"{key} mismatch in {path}")
+
+    if offsets:
+      step = max((pts[-1] - pts[0]) // max(len(pts) - 1, 1), 1)
+      for offset, frame_pts in zip(offsets, pts):
+        PTS.pack_into(data, offset + 4, frame_pts - pts[0] + self.pts)
+      self.pts += pts[-1] - pts[0] + step
+
+    self.file.truncate(self.size)
+    self.file.seek(self.size)
+    self.file.write(data)
+    self.size += len(data)
+    self.frames += len(offsets)
+
+    self.file.seek(FRAME_COUNT_OFFSET)
+    self.file.write(struct.pack("<I", self.frames))
+    return len(offsets)
+
+  def close(self):
+    if self.file:
+      self.file.close()
+      self.file = None
+
+def join(paths, path_out, cb=None):
+  writer = IvfWriter(path_out)
+  try:
+    for path in paths:
+      writer.append(path)
+      if cb:
+        cb(writer.frames)
+  finally:
+    writer.close()
+  return writer.frames
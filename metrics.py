@@ -0,0 +1,95 @@
+import bisect
+from threading import Lock
+
+def format_labels(labels):
+  if not labels: return ""
+  escaped = [(k, str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")) for k, v in labels]
+  return "{" + ",".join(f"{k}=\"{v}\"" for k, v in escaped) + "}"
+
+class Counter:
+  def __init__(self, name, help, labels=()):
+    self.name = name
+    self.help = help
+    self.labels = labels
+    self.values = {}
+    self.lock = Lock()
+
+  def inc(self, value=1, **labels):
+    key = tuple(labels[label] for label in self.labels)
+    with self.lock:
+      self.values[key] = self.values.get(key, 0) + value
+
+  def render(self):
+    lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+    with self.lock:
+      for key, value in self.values.items():
+        lines.append(f"{self.name}{format_labels(zip(self.labels, key))} {value}")
+    return lines
+
+class Histogram:
+  def __init__(self, name, help, buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)):
+    self.name = name
+    self.help = help
+    self.buckets = list(buckets)
+    self.counts = [0] * (len(self.buckets) + 1)
+    self.sum = 0
+    self.lock = Lock()
+
+  def observe(self, value):
+    i = bisect.bisect_left(self.buckets, value)
+    with self.lock:
+      self.counts[i] += 1
+      self.sum += value
+
+  def render(self):
+    lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+    with self.lock:
+      counts = list(self.counts)
+      total = self.sum
+
+    cumulative = 0
+    for le, count in zip(self.buckets + ["+Inf"], counts):
+      cumulative += count
+      lines.append(f"{self.name}_bucket{format_labels([('le', le)])} {cumulative}")
+
+    lines.append(f"{self.name}_sum {total}")
+    lines.append(f"{self.name}_count {cumulative}")
+    return lines
+
+def gauge(name, help, values):
+  lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+  for labels, value in values:
+    lines.append(f"{name}{format_labels(labels)} {value}")
+  return lines
+
+class Metrics:
+  def __init__(self):
+    self.get_job_seconds = Histogram("grav1_get_job_seconds", "Time spent selecting a job in get_job")
+    self.lock_wait_seconds = Histogram("grav1_projects_lock_wait_seconds", "Time spent waiting for projects_lock in get_job")
+    self.check_job = Counter("grav1_check_job_total", "Uploaded segments by verification result", ("result",))
+    self.bytes_sent = Counter("grav1_bytes_sent_total", "Bytes of segments sent", ("endpoint",))
+
+  def render(self, projects):
+    lines = []
+    lines.extend(self.get_job_seconds.render())
+    lines.extend(self.lock_wait_seconds.render())
+    lines.extend(self.check_job.render())
+    lines.extend(self.bytes_sent.render())
+
+    pending = []
+    assigned = []
+    for project in list(projects.values()):
+      jobs = list(project.jobs.values())
+      pending.append(([("project", project.projectid)], len(jobs)))
+      assigned.append(([("project", project.projectid)], sum(len(job.workers) for job in jobs)))
+
+    lines.extend(gauge("grav1_pending_jobs", "Jobs waiting to be encoded", pending))
+    lines.extend(gauge("grav1_assigned_workers", "Workers currently assigned to jobs", assigned))
+    lines.extend(gauge("grav1_action_queue_depth", "Actions waiting in the action queue", [([], len(projects.action_executor))]))
+    lines.extend(gauge("grav1_splitting_projects", "Inputs being split", [([], len(projects.splitting))]))
+
+    verifier = projects.verifier.status()
+    lines.extend(gauge("grav1_verification_queue_depth", "Uploads waiting for verification", [([], verifier["queued"])]))
+    lines.extend(gauge("grav1_verification_running", "Uploads being verified", [([], verifier["running"])]))
+
+    return "\n".join(lines) + "\n"
@@ -1,53 +1,128 @@
-import os, json, time, subprocess, re, logging, shutil
-from threading import Thread, Event, Lock
+import os, time, subprocess, re, logging, itertools, heapq
+from threading import Thread, Lock
+from concurrent.futures import ThreadPoolExecutor
 
 from grav1ty.split import split, verify_split
 from grav1ty.util import ffmpeg, get_frames
-from util import tmp_file, tmp_save
+from util import tmp_file, save_tmp, move_file, file_checksum
+from ivf import IvfWriter, IvfError, join
+from scheduler import JobQueue
+from store import Store
+from verifier import Verifier
+from telemetry import Telemetry
+from metrics import Metrics
+from uploads import Uploads
+from sessions import Sessions, legacy_accept
+from executor import ActionExecutor
 
 from actions import actions
 
 from logger import NET
 
 class Projects:
-  def __init__(self, working_dir):
+  def __init__(self, working_dir, lease_time=300, split_workers=None, action_workers=None):
     self.projects = {}
     self.working_dir = working_dir
     self.path_projects = os.path.join(working_dir, "projects.json")
     self.path_scenes = os.path.join(working_dir, "scenes")
     self.path_jobs = os.path.join(working_dir, "jobs")
     self.path_checking = os.path.join(working_dir, "checking")
+    self.path_db = os.path.join(working_dir, "projects.db")
+
+    self.store = Store(self.path_db)
 
     self.actions = actions
 
-    self.action_queue = []
-    self.action_event = Event()
-    Thread(target=self.action_loop, daemon=True).start()
+    self.action_executor = ActionExecutor(action_workers, on_done=self.save_projects, on_change=self.touch)
+
+    self.split_executor = ThreadPoolExecutor(max_workers=split_workers or max((os.cpu_count() or 1) // 4, 1))
+    self.splitting = set()
+
+    self.telemetry = Telemetry()
+    self.metrics = Metrics()
 
-    self.telemetry = {"encodes": [], "fph": 0, "fph_time": 0}
+    self.job_queue = JobQueue()
+    self.lease_time = lease_time
+    self.leases = []
+    self.lease_counter = itertools.count()
+    self.generations = itertools.count(1)
+    self.generation = 0
+
+    self.verifier = Verifier(on_change=self.touch)
+    self.uploads = Uploads(self.path_checking)
+    self.sessions = Sessions()
 
     self.projects_lock = Lock()
     self.save_lock = Lock()
 
-  def action_loop(self):
-    while self.action_event.wait():
-      while len(self.action_queue) > 0:
-        self.action_queue.pop(0)()
-        self.save_projects()
+    Thread(target=self.lease_loop, daemon=True).start()
+
+  def lease_loop(self):
+    while True:
+      time.sleep(min(self.lease_time / 4, 15))
+      self.expire_leases()
+
+  def expire_leases(self):
+    now = time.time()
+    expired = []
+    with self.projects_lock:
+      while self.leases and self.leases[0][0] <= now:
+        expires, _, job, workerid = heapq.heappop(self.leases)
+        if job.leases.get(workerid) != expires or job.scene not in job.project.jobs: continue
+        self._release(job, workerid)
+        expired.append((job, workerid))
+
+    for job, workerid in expired:
+      logging.log(NET, "lease expired", job.project.projectid, job.scene, "from", workerid)
+
+    if expired:
+      self.touch()
+
+  def _lease(self, job, workerid, expires):
+    job.leases[workerid] = expires
+    heapq.heappush(self.leases, (expires, next(self.lease_counter), job, workerid))
+
+  def _release(self, job, workerid):
+    if workerid in job.workers:
+      job.workers.remove(workerid)
+    job.leases.pop(workerid, None)
+    job.progress.pop(workerid, None)
+    self.job_queue.update(job)
+
+  def heartbeat(self, jobs):
+    done = []
+    expires = time.time() + self.lease_time
+    with self.projects_lock:
+      for info in jobs:
+        projectid, scene, workerid = str(info["projectid"]), str(info["scene"]), info["id"]
+        if projectid not in self.projects or scene not in self.projects[projectid].jobs:
+          done.append({"projectid": projectid, "scene": scene})
+          continue
+
+        job = self.projects[projectid].jobs[scene]
+        if workerid not in job.workers: continue
 
-      self.action_event.clear()
+        self._lease(job, workerid, expires)
+        if "progress" in info:
+          job.progress[workerid] = min(max(float(info["progress"]), 0), 1)
+          self.job_queue.update(job)
+
+    return done
 
   def values(self):
     return self.projects.values()
 
-  def add_action(self, action):
-    self.action_queue.append(action)
+  def touch(self):
+    self.generation = next(self.generations)
+
+  def add_action(self, project, action, name="", cancellable=True):
+    return self.action_executor.submit(project.projectid, action, name, cancellable)
 
-    if len(self.action_queue) > 0:
-      self.action_event.set()
+  def cancel_actions(self, project, action_id=None):
+    return self.action_executor.cancel(project.projectid, action_id)
 
   def project_on_complete(self, project):
-    self.add_action(lambda: actions[project.action](self, project))
+    self.add_action(project, lambda: actions[project.action](self, project), project.action)
 
   def add(self, project, action="", save=True):
     logging.info("added project", project.projectid)
@@ -58,117 +133,211 @@ class Projects:
       project.on_complete = self.project_on_complete
 
     self.projects[project.projectid] = project
+    self.touch()
     
     if save:
       self.save_projects()
 
     if project.start():
-      self.add_action(project.split)
+      self.split_project(project)
+
+  def split_project(self, project):
+    self.splitting.add(project.projectid)
+    self.split_executor.submit(self._split_project, project)
+
+  def _split_project(self, project):
+    try:
+      project.split()
+    except:
+      logging.info(project.projectid, "split failed")
+      project.set_status("split failed")
+    finally:
+      self.splitting.discard(project.projectid)
+      self.touch()
+
+  def add_job(self, job):
+    with self.projects_lock:
+      if self.projects.get(job.project.projectid) is not job.project: return
+      job.project.jobs[job.scene] = job
+      self.job_queue.push(job)
+    self.touch()
 
-  def get_job(self, skip_jobs, workerid):
-    all_jobs = []
+  def reset_job(self, job):
+    with self.projects_lock:
+      for workerid in list(job.workers):
+        self._release(job, workerid)
+    self.touch()
 
+  def set_priority(self, project, priority):
     with self.projects_lock:
-      for pid in self.projects:
-        project = self.projects[pid]
-        all_jobs.extend(project.jobs.values())
+      project.priority = priority
+      self.job_queue.update_project(project)
+    self.touch()
 
-      all_jobs = [job for job in all_jobs if not any(job.scene == job2["scene"] and str(job.project.projectid) == str(job2["projectid"]) for job2 in skip_jobs)]
-      all_jobs = sorted(all_jobs, key=lambda job: (job.project.priority, len(job.workers), -job.frames))
+  def get_job(self, skip_jobs, workerid, session=None):
+    jobs = self.get_jobs(skip_jobs, workerid, 1, session)
+    return jobs[0] if jobs else None
 
-      if len(all_jobs) > 0:
-        job = all_jobs[0]
-        job.workers.append(workerid)
-        return job
-      else: return None
+  def get_jobs(self, skip_jobs, workerid, count, session=None):
+    skip = {(str(job["projectid"]), str(job["scene"])) for job in skip_jobs}
+    jobs = []
 
-  def hit(self, frames):
-    now = time.time()
-    self.telemetry["encodes"] = list(filter(lambda x: (now - x[1]) < 3600, self.telemetry["encodes"]))
-    self.telemetry["encodes"].append((frames, now))
+    start = time.perf_counter()
+    with self.projects_lock:
+      acquired = time.perf_counter()
+      expires = time.time() + self.lease_time
+      while len(jobs) < count:
+        job = self.job_queue.pop(skip, workerid, session.accept if session else legacy_accept)
+        if not job: break
+        self._lease(job, workerid, expires)
+        skip.add(self.job_queue.job_id(job))
+        jobs.append(job)
+
+    self.metrics.lock_wait_seconds.observe(acquired - start)
+    self.metrics.get_job_seconds.observe(time.perf_counter() - start)
+
+    if jobs:
+      self.touch()
+
+    return jobs
+
+  def worker_name(self, client):
+    return client.rsplit(":", 1)[0]
+
+  def hit(self, job, client, size, latency):
+    self.telemetry.encode(job.project.projectid, job.encoder, self.worker_name(client), job.frames, size, latency)
 
-    self.telemetry["fph"] = sum([x[0] for x in self.telemetry["encodes"]])
-    self.telemetry["fph_time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.telemetry["encodes"][-1][1]))
+  def reject(self, job, client, reason, *info, latency=None):
+    logging.log(NET, "discard from", client, job.project.projectid, job.scene, reason, *info)
+    self.remove_worker(job, client)
+    self.telemetry.reject(job.project.projectid, job.encoder, self.worker_name(client), reason, latency)
 
   def remove_worker(self, job, client):
     with self.projects_lock:
-      if client in job.workers:
-        job.workers.remove(client)
+      self._release(job, client)
+    self.touch()
+
+  def check_job(self, projectid, client, encoder, encoder_params, ffmpeg_params, scene_number, grain, file, passes="2", segment=None):
+    result, ticket = self.submit_job(projectid, client, encoder, encoder_params, ffmpeg_params, scene_number, grain, file, passes, segment)
+    if not ticket:
+      return result
+
+    return self.verifier.result(ticket)
 
-  def check_job(self, projectid, client, encoder, encoder_params, ffmpeg_params, scene_number, grain, file):
+  def submit_job(self, projectid, client, encoder, encoder_params, ffmpeg_params, scene_number, grain, file, passes="2", segment=None):
+    result, ticket = self._submit_job(projectid, client, encoder, encoder_params, ffmpeg_params, scene_number, grain, file, passes, segment)
+    if not ticket:
+      self.metrics.check_job.inc(result=result)
+    return result, ticket
+
+  def _submit_job(self, projectid, client, encoder, encoder_params, ffmpeg_params, scene_number, grain, file, passes, segment):
     if projectid not in self.projects:
       logging.info("project not found", projectid)
-      return "project not found"
+      return "project not found", None
 
     project = self.projects[projectid]
 
     if scene_number not in project.jobs:
       logging.info("job not found", projectid, scene_number)
-      return "job not found"
+      return "job not found", None
 
     job = project.jobs[scene_number]
     scene = project.scenes[scene_number]
     
-    if job.grain != grain or job.encoder_params != encoder_params or job.ffmpeg_params != ffmpeg_params or job.encoder != encoder:
-      logging.log(NET, "discard from", client, projectid, scene_number, "bad params")
-      self.remove_worker(job, client)
-      return "bad params"
+    if job.grain != grain or job.encoder_params != encoder_params or job.ffmpeg_params != ffmpeg_params or job.encoder != encoder or job.passes != passes:
+      self.reject(job, client, "bad params")
+      return "bad params", None
 
     if scene["filesize"] > 0:
-      logging.log(NET, "discard from", client, projectid, scene_number, "already done")
-      self.remove_worker(job, client)
-      return "already done"
-
-    os.makedirs(self.path_checking, exist_ok=True)
-    with tmp_save(file, self.path_checking, suffix=job.encoded_filename) as tmp_enc:
-      if os.stat(tmp_enc).st_size == 0:
-        logging.log(NET, "discard from", client, projectid, scene_number, "bad upload")
-        self.remove_worker(job, client)
-        return "bad upload"
+      self.reject(job, client, "already done")
+      return "already done", None
+
+    if segment and segment != file_checksum(job.path):
+      self.reject(job, client, "stale segment")
+      return "stale segment", None
+
+    if isinstance(file, str):
+      tmp_enc = file
+    else:
+      os.makedirs(self.path_checking, exist_ok=True)
+      tmp_enc = save_tmp(file, self.path_checking, suffix=job.encoded_filename)
+
+    return "pending", self.verifier.submit(self.verify_job, project, job, client, tmp_enc, time.time())
+
+  def verify_job(self, project, job, client, tmp_enc, submitted):
+    try:
+      result = self._verify_job(project, job, client, tmp_enc, submitted)
+      self.metrics.check_job.inc(result=result)
+      return result
+    finally:
+      if os.path.exists(tmp_enc):
+        os.unlink(tmp_enc)
+
+  def _verify_job(self, project, job, client, tmp_enc, submitted):
+    projectid = project.projectid
+    scene_number = job.scene
+    scene = project.scenes[scene_number]
+
+    if os.stat(tmp_enc).st_size == 0:
+      self.reject(job, client, "bad upload", latency=time.time() - submitted)
+      return "bad upload"
+    
+    if job.encoder == "aom":
+      dav1d = subprocess.run([
+        "dav1d",
+        "-i", tmp_enc,
+        "-o", "/dev/null",
+        "--framethreads", "1",
+        "--tilethreads", "16"
+      ], capture_output=True)
+
+      if dav1d.returncode == 1:
+        self.reject(job, client, "bad encode", "dav1d decode error", latency=time.time() - submitted)
+        return "bad encode"
       
-      if job.encoder == "aom":
-        dav1d = subprocess.run([
-          "dav1d",
-          "-i", tmp_enc,
-          "-o", "/dev/null",
-          "--framethreads", "1",
-          "--tilethreads", "16"
-        ], capture_output=True)
-
-        if dav1d.returncode == 1:
-          logging.log(NET, "discard from", client, projectid, scene_number, "dav1d decode error")
-          self.remove_worker(job, client)
-          return "bad encode"
-        
-        encoded_frames = int(re.search(r"Decoded [0-9]+/([0-9]+) frames", dav1d.stdout.decode("utf-8") + dav1d.stderr.decode("utf-8")).group(1))
-      else:
-        encoded_frames = get_frames(tmp_enc)
-
-      if scene["frames"] != encoded_frames:
-        logging.log(NET, "discard from", client, projectid, scene_number, "frame mismatch", encoded_frames, "/", scene["frames"])
-        self.remove_worker(job, client)
-        return "frame mismatch"
-
-      scene["filesize"] = os.stat(tmp_enc).st_size
+      encoded_frames = int(re.search(r"Decoded [0-9]+/([0-9]+) frames", dav1d.stdout.decode("utf-8") + dav1d.stderr.decode("utf-8")).group(1))
+    else:
+      encoded_frames = get_frames(tmp_enc)
 
-      os.makedirs(project.path_encode, exist_ok=True)
-      encoded = os.path.join(project.path_encode, job.encoded_filename)
-      shutil.copyfile(tmp_enc, encoded)
+    if scene["frames"] != encoded_frames:
+      self.reject(job, client, "frame mismatch", encoded_frames, "/", scene["frames"], latency=time.time() - submitted)
+      return "frame mismatch"
 
     with self.projects_lock:
+      if scene_number not in project.jobs:
+        logging.log(NET, "discard from", client, projectid, scene_number, "already done")
+        return "already done"
+
+      del project.jobs[scene_number]
+      self.job_queue.remove(job)
+
       if client in job.workers:
         project.encoded_frames += scene["frames"]
-        
-      del project.jobs[scene_number]
+
+    filesize = os.stat(tmp_enc).st_size
+
+    try:
+      os.makedirs(project.path_encode, exist_ok=True)
+      encoded = os.path.join(project.path_encode, job.encoded_filename)
+      move_file(tmp_enc, encoded)
+    except:
+      self.add_job(job)
+      raise
+
+    project.set_filesize(scene_number, filesize)
+    self.touch()
 
     logging.log(NET, "recv", projectid, scene_number, "from", client)
-    self.hit(scene["frames"])
+    self.hit(job, client, filesize, time.time() - submitted)
 
-    self.save_projects()
+    self.save_scene(project, scene_number)
+
+    if scene_number == project.concat_next:
+      project.queue_append()
 
     if len(project.jobs) == 0 and project.get_frames() == project.total_frames:
       logging.info("done", projectid)
-      self.add_action(project.complete)
+      self.add_action(project, project.complete, "complete")
       
     return "saved"
 
@@ -183,34 +352,61 @@ class Projects:
 
   def __delitem__(self, key):
     if key in self.projects:
-      del self.projects[key]
-    self.save_projects()
+      self.projects[key].stopped = True
+      with self.projects_lock:
+        self.job_queue.remove_project(self.projects[key])
+        self.action_executor.cancel(key, force=True)
+        del self.projects[key]
+      self.touch()
+    with self.save_lock:
+      self.store.delete_project(key)
+
+  def project_data(self, project):
+    return {
+      "priority": project.priority,
+      "path_in": project.path_in,
+      "encoder_params": project.encoder_params,
+      "ffmpeg_params": project.ffmpeg_params,
+      "min_frames": project.min_frames,
+      "max_frames": project.max_frames,
+      "encoder": project.encoder,
+      "input_frames": project.input_total_frames,
+      "on_complete": project.action,
+      "grain": project.grain,
+      "passes": project.passes,
+      "verifying": project.verifying,
+      "concat": project.concat_state
+    }
 
   def save_projects(self):
     with self.save_lock:
-      os.makedirs(os.path.join(self.working_dir, "scenes"), exist_ok=True)
-    
       dict_projects = {}
-      for project in self.projects.values():
-        dict_projects[project.projectid] = {
-          "priority": project.priority,
-          "path_in": project.path_in,
-          "encoder_params": project.encoder_params,
-          "ffmpeg_params": project.ffmpeg_params,
-          "min_frames": project.min_frames,
-          "max_frames": project.max_frames,
-          "encoder": project.encoder,
-          "input_frames": project.input_total_frames,
-          "on_complete": project.action,
-          "grain": project.grain
-        }
-        json.dump(project.scenes, open(os.path.join(self.path_scenes, f"{project.projectid}.json"), "w+"), indent=2)
-      
-      json.dump(dict_projects, open(self.path_projects, "w+"), indent=2)
+      dict_scenes = {}
+      for project in list(self.projects.values()):
+        dict_projects[project.projectid] = self.project_data(project)
+        if project.scenes_dirty:
+          project.scenes_dirty = False
+          dict_scenes[project.projectid] = dict(project.scenes)
+
+      self.store.put_projects(dict_projects, dict_scenes)
+
+  def save_project(self, project):
+    with self.save_lock:
+      if self.projects.get(project.projectid) is not project: return
+      project.scenes_dirty = False
+      self.store.put_projects({project.projectid: self.project_data(project)}, {project.projectid: dict(project.scenes)})
+
+  def save_scene(self, project, scene):
+    with self.save_lock:
+      if self.projects.get(project.projectid) is not project: return
+      self.store.put_scene(project.projectid, scene, project.scenes[scene])
 
   def load_projects(self):
-    if not os.path.isfile("projects.json"): return
-    projects = json.load(open("projects.json", "r"))
+    if len(self.store) == 0 and os.path.isfile(self.path_projects):
+      logging.info("importing", self.path_projects)
+      self.store.import_json(self.path_projects, self.path_scenes)
+
+    projects = self.store.get_projects()
     for pid in projects:
       project_data = projects[pid]
 
@@ -223,12 +419,16 @@ class Projects:
           ffmpeg_params=project_data["ffmpeg_params"] if "ffmpeg_params" in project_data else "",
           min_frames=project_data["min_frames"] if "min_frames" in project_data else -1,
           max_frames=project_data["max_frames"] if "max_frames" in project_data else -1,
-          scenes=json.load(open(os.path.join(self.path_scenes, f"{pid}.json"), "r")) if os.path.isfile(os.path.join(self.path_scenes, f"{pid}.json")) else {},
+          scenes=self.store.get_scenes(pid),
           total_frames=project_data["input_frames"] if "input_frames" in project_data else 0,
           priority=project_data["priority"] if "priority" in project_data else 0,
           id=pid,
-          grain=project_data["grain"] if "grain" in project_data else False
+          grain=project_data["grain"] if "grain" in project_data else False,
+          passes=project_data["passes"] if "passes" in project_data else "2"
         )
+        project.verifying = project_data["verifying"] if "verifying" in project_data else False
+        if "concat" in project_data:
+          project.concat_state = project_data["concat"]
       except:
         logging.info("Failed to load project", pid)
         continue
@@ -236,10 +436,12 @@ class Projects:
       self.add(project, project_data["on_complete"] if "on_complete" in project_data else "", save=False)
 
 class Project:
-  def __init__(self, filename, path, encoder, encoder_params, ffmpeg_params="", min_frames=-1, max_frames=-1, scenes={}, total_frames=0, priority=0, id=0, grain=False):
+  def __init__(self, filename, path, encoder, encoder_params, ffmpeg_params="", min_frames=-1, max_frames=-1, scenes={}, total_frames=0, priority=0, id=0, grain=False, passes="2"):
     self.projectid = id or str(time.time())
     self.path_in = filename
     self.path_out = os.path.join(path, self.projectid, "completed.webm")
+    self.path_joined = os.path.join(path, self.projectid, "completed.ivf")
+    self.path_progressive = os.path.join(path, self.projectid, "completed.ivf.part")
     self.path_split = os.path.join(path, self.projectid, "split")
     self.path_encode = os.path.join(path, self.projectid, "encode")
     self.status = "starting"
@@ -250,11 +452,14 @@ class Project:
     self.encoder_params = encoder_params
     self.ffmpeg_params = ffmpeg_params
     self.scenes = scenes
+    self.scenes_dirty = False
     self.total_jobs = 0
     self.priority = priority
     self.stopped = False
+    self.verifying = False
 
     self.grain = grain
+    self.passes = passes
     self.path_grain = os.path.join(path, self.projectid, "grain")
 
     self.input_total_frames = total_frames
@@ -263,16 +468,45 @@ class Project:
     self.encoded_frames = 0
     self.encode_start = None
 
+    self.completed_frames = 0
+    self.completed_size = 0
+    self.totals_lock = Lock()
+
+    self.concat_state = {"index": 0, "frames": 0, "pts": 0, "size": 0}
+    self.concat_next = None
+    self.append_pending = False
+
     self.action = ""
     self.on_complete = None
 
     self.projects = None
   
   def get_frames(self):
-    return sum([self.scenes[scene]["frames"] for scene in self.scenes if self.scenes[scene]["filesize"] != 0])
+    return self.completed_frames
+
+  def get_size(self):
+    return self.completed_size
+
+  def update_totals(self):
+    with self.totals_lock:
+      scenes = [scene for scene in self.scenes.values() if scene.get("filesize", 0) != 0]
+      self.completed_frames = sum(scene["frames"] for scene in scenes)
+      self.completed_size = sum(scene["filesize"] for scene in scenes)
+
+  def set_filesize(self, scene_n, filesize):
+    with self.totals_lock:
+      scene = self.scenes[scene_n]
+      old_filesize = scene.get("filesize", 0)
+      scene["filesize"] = filesize
+
+      self.completed_size += filesize - old_filesize
+      if old_filesize == 0 and filesize != 0:
+        self.completed_frames += scene["frames"]
+      elif old_filesize != 0 and filesize == 0:
+        self.completed_frames -= scene["frames"]
 
   def start(self):
-    if not os.path.isdir(self.path_split) or len(os.listdir(self.path_split)) == 0:
+    if self.verifying or not os.path.isdir(self.path_split) or len(os.listdir(self.path_split)) == 0:
       return True
 
     self.total_jobs = len(self.scenes)
@@ -282,9 +516,15 @@ class Project:
 
     for scene in self.scenes:
       file_ivf = os.path.join(self.path_encode, self.get_encoded_filename(scene))
-      self.scenes[scene]["filesize"] = os.stat(file_ivf).st_size if os.path.isfile(file_ivf) else 0
+      filesize = os.stat(file_ivf).st_size if os.path.isfile(file_ivf) else 0
+      if self.scenes[scene].get("filesize") != filesize:
+        self.scenes[scene]["filesize"] = filesize
+        self.scenes_dirty = True
       self.total_frames += self.scenes[scene]["frames"]
 
+    self.update_totals()
+    self.resume_concat()
+
     logging.info(self.projectid, "loaded")
 
     if self.stopped: return
@@ -294,23 +534,7 @@ class Project:
         if self.scenes[scene]["filesize"] > 0 or "bad" in self.scenes[scene]:
           continue
 
-        encoded_filename = self.get_encoded_filename(scene)
-
-        scene_setting = self.encoder_params
-        scene_setting_ffmpeg = self.ffmpeg_params
-
-        self.jobs[scene] = Job(
-          self,
-          scene,
-          self.encoder,
-          os.path.join(self.path_split, self.scenes[scene]["segment"]),
-          encoded_filename,
-          scene_setting,
-          scene_setting_ffmpeg,
-          self.scenes[scene]["start"],
-          self.scenes[scene]["frames"],
-          self.grain
-        )
+        self.publish(scene)
 
       self.set_status("ready")
     else:
@@ -320,14 +544,48 @@ class Project:
     if os.path.isfile(self.path_out):
       self.set_status("complete")
     else:
-      self.complete()
+      self.projects.add_action(self, self.complete, "complete")
+
+  def publish(self, scene):
+    self.projects.add_job(Job(
+      self,
+      scene,
+      self.encoder,
+      os.path.join(self.path_split, self.scenes[scene]["segment"]),
+      self.get_encoded_filename(scene),
+      self.encoder_params,
+      self.ffmpeg_params,
+      self.scenes[scene]["start"],
+      self.scenes[scene]["frames"],
+      self.grain,
+      self.passes
+    ))
+
+  def add_scene(self, scene, data):
+    data.setdefault("filesize", 0)
+    self.scenes[scene] = data
+    self.scenes_dirty = True
+    self.total_jobs += 1
+    self.total_frames += data["frames"]
+
+    if data["filesize"] == 0 and "bad" not in data:
+      self.publish(scene)
+
+  def segment_stats(self):
+    stats = {}
+    for scene, data in self.scenes.items():
+      path = os.path.join(self.path_split, data["segment"])
+      if os.path.isfile(path):
+        stat = os.stat(path)
+        stats[scene] = (stat.st_mtime, stat.st_size)
+    return stats
 
   def split(self):
     if self.stopped: return
     
     self.set_status("splitting")
     logging.info(self.projectid, "splitting")
-    self.scenes, self.input_total_frames, segments = split(
+    scenes, self.input_total_frames, segments = split(
       self.path_in,
       self.path_split,
       self.min_frames,
@@ -335,8 +593,34 @@ class Project:
       cb=lambda message, cr=False: logging.info(self.projectid, message, extra={"cr": cr})
     )
 
+    self.scenes = {}
+    self.total_frames = 0
+    self.total_jobs = 0
+    self.reset_concat()
+
+    if sum(scene["frames"] for scene in scenes.values()) != self.input_total_frames:
+      for scene in sorted(scenes):
+        scenes[scene].setdefault("filesize", 0)
+      self.scenes = scenes
+      self.scenes_dirty = True
+      self.total_jobs = len(scenes)
+      self.total_frames = sum(scene["frames"] for scene in scenes.values())
+      self.verifying = False
+      logging.info(self.projectid, "total frame mismatch", self.total_frames, self.input_total_frames)
+      self.set_status("total frame mismatch")
+      self.projects.save_project(self)
+      return
+
+    self.verifying = True
+    for scene in sorted(scenes):
+      if self.stopped: return
+      self.add_scene(scene, scenes[scene])
+
+    self.projects.save_project(self)
+
     logging.info(self.projectid, "verifying split")
     self.set_status("verifying split")
+    before = self.segment_stats()
     verify_split(
       self.path_in,
       self.path_split,
@@ -344,13 +628,49 @@ class Project:
       cb=lambda message, cr=False: logging.info(self.projectid, message, extra={"cr": cr})
     )
 
-    self.projects.save_projects()
-    self.start()
+    if self.stopped: return
+
+    changed = []
+    for scene, stat in self.segment_stats().items():
+      if before.get(scene) == stat: continue
+      logging.info(self.projectid, "segment changed by verification", scene)
+      if scene in self.jobs:
+        self.projects.reset_job(self.jobs[scene])
+      elif self.scenes[scene].get("filesize", 0) > 0:
+        changed.append(scene)
+
+    self.projects.add_action(self, lambda: self.verified(changed), "verified", cancellable=False)
+
+  def verified(self, changed):
+    if self.stopped: return
+
+    keys = sorted(self.scenes)
+    if self.concat_state and any(keys.index(scene) < self.concat_state["index"] for scene in changed):
+      logging.info(self.projectid, "progressive concat restarted")
+      self.reset_concat()
+
+    for scene in changed:
+      file_ivf = os.path.join(self.path_encode, self.get_encoded_filename(scene))
+      if os.path.isfile(file_ivf):
+        os.remove(file_ivf)
+      self.set_filesize(scene, 0)
+      self.projects.save_scene(self, scene)
+      self.publish(scene)
+
+    self.verifying = False
+    self.resume_concat()
+    self.set_status("ready")
+    self.projects.save_project(self)
+    self.complete()
 
   def complete(self):
+    if self.verifying: return
     if len(self.jobs) == 0 and self.get_frames() == self.total_frames:
       self.set_status("done! joining files")
-      self.concat()
+      if not self.concat():
+        logging.info(self.projectid, "concat failed")
+        self.set_status("concat failed")
+        return
       self.set_status("complete")
       logging.info(self.projectid, "completed")
       if self.on_complete:
@@ -358,23 +678,105 @@ class Project:
 
   def set_status(self, msg):
     self.status = msg
+    if self.projects:
+      self.projects.touch()
 
   def get_encoded_filename(self, scene_n):
     return f"{scene_n}.ivf"
 
+  def reset_concat(self):
+    self.concat_state = {"index": 0, "frames": 0, "pts": 0, "size": 0}
+    self.concat_next = None
+    if os.path.isfile(self.path_progressive):
+      os.remove(self.path_progressive)
+
+  def resume_concat(self):
+    if self.concat_state is None or os.path.isfile(self.path_out): return
+
+    if self.concat_state["index"] > 0:
+      size = os.path.getsize(self.path_progressive) if os.path.isfile(self.path_progressive) else 0
+      if size < self.concat_state["size"] or self.concat_state["index"] > len(self.scenes):
+        logging.info(self.projectid, "progressive concat restarted")
+        self.reset_concat()
+
+    keys = sorted(self.scenes)
+    self.concat_next = keys[self.concat_state["index"]] if self.concat_state["index"] < len(keys) else None
+    self.queue_append()
+
+  def queue_append(self):
+    if self.concat_next and self.scenes[self.concat_next].get("filesize", 0) > 0 and self.projects and not self.append_pending:
+      self.append_pending = True
+      self.projects.add_action(self, self.append_ready, "append", cancellable=False)
+
+  def append_ready(self):
+    self.append_pending = False
+    if self.concat_state is None: return
+
+    keys = sorted(self.scenes)
+    state = self.concat_state
+    writer = IvfWriter(self.path_progressive, state["frames"], state["pts"], state["size"])
+    index = state["index"]
+
+    try:
+      while index < len(keys) and self.scenes[keys[index]].get("filesize", 0) > 0:
+        writer.append(os.path.join(self.path_encode, self.get_encoded_filename(keys[index])))
+        index += 1
+        self.concat_state = dict(writer.state(), index=index)
+    except (IvfError, OSError) as e:
+      logging.info(self.projectid, "progressive concat disabled:", e)
+      self.concat_state = None
+      self.concat_next = None
+      return
+    finally:
+      writer.close()
+
+    self.concat_next = keys[index] if index < len(keys) else None
+    self.queue_append()
+
   def concat(self):
-    logging.info(self.projectid, "concat")
+    self.append_ready()
     keys = list(self.scenes.keys())
     keys.sort()
+    cb = lambda x: (self.set_status(f"concat {x}/{self.total_frames}"), logging.info(self.projectid, "concat", f"{x}/{self.total_frames}", extra={"cr": True}))
+
+    joined = True
+    if self.concat_state and self.concat_state["index"] == len(self.scenes) and os.path.isfile(self.path_progressive):
+      os.replace(self.path_progressive, self.path_joined)
+    else:
+      logging.info(self.projectid, "concat")
+      try:
+        join([os.path.join(self.path_encode, self.get_encoded_filename(scene)) for scene in keys], self.path_joined, cb)
+      except (IvfError, OSError) as e:
+        logging.info(self.projectid, "ivf concat failed, falling back to ffmpeg:", e)
+        if os.path.isfile(self.path_joined):
+          os.remove(self.path_joined)
+        joined = False
+
+    if joined:
+      ffmpeg(["ffmpeg", "-hide_banner", "-y", "-i", self.path_joined, "-c", "copy", self.path_out], cb)
+      if not self.has_output():
+        return False
+      os.remove(self.path_joined)
+      return True
+
     scenes = [os.path.join(self.path_encode, self.get_encoded_filename(os.path.splitext(scene)[0])).replace("\\", "/") for scene in keys]
     content = "\n".join([f"file '{scene}'" for scene in scenes])
     with tmp_file("w", content) as file:
       cmd = f"ffmpeg -hide_banner -f concat -safe 0 -y -i".split(" ")
       cmd.extend([file, "-c", "copy", self.path_out])
-      ffmpeg(cmd, lambda x: (self.set_status(f"concat {x}/{self.total_frames}"), logging.info(self.projectid, "concat", f"{x}/{self.total_frames}", extra={"cr": True})))
+      ffmpeg(cmd, cb)
+
+    return self.has_output()
+
+  def has_output(self):
+    if os.path.isfile(self.path_out) and os.path.getsize(self.path_out) > 0:
+      return True
+    if os.path.isfile(self.path_out):
+      os.remove(self.path_out)
+    return False
 
 class Job:
-  def __init__(self, project, scene, encoder, path, encoded_filename, encoder_params, ffmpeg_params, start, frames, grain):
+  def __init__(self, project, scene, encoder, path, encoded_filename, encoder_params, ffmpeg_params, start, frames, grain, passes="2"):
     self.project = project
     self.scene = scene
     self.encoder = encoder
@@ -384,6 +786,9 @@ class Job:
     self.encoder_params = encoder_params
     self.ffmpeg_params = ffmpeg_params
     self.workers = []
+    self.leases = {}
+    self.progress = {}
     self.start = start
     self.frames = frames
     self.grain = grain
+    self.passes = passes
@@ -0,0 +1,103 @@
+import heapq, itertools
+
+class JobQueue:
+  def __init__(self):
+    self.heaps = {}
+    self.entries = {}
+    self.order = {}
+    self.unassigned = set()
+    self.counter = itertools.count()
+
+  def __len__(self):
+    return len(self.entries)
+
+  def job_id(self, job):
+    return (str(job.project.projectid), str(job.scene))
+
+  def kind(self, job):
+    return (job.encoder, job.passes)
+
+  def key(self, job):
+    return (job.project.priority, len(job.workers), max(job.progress.values(), default=0), -job.frames)
+
+  def push(self, job):
+    job_id = self.job_id(job)
+    self._invalidate(job_id)
+
+    if job_id not in self.order:
+      self.order[job_id] = next(self.counter)
+
+    entry = [self.key(job), self.order[job_id], next(self.counter), job, True]
+    self.entries[job_id] = entry
+
+    if len(job.workers) == 0:
+      self.unassigned.add(job_id)
+    else:
+      self.unassigned.discard(job_id)
+    heapq.heappush(self.heaps.setdefault(self.kind(job), []), entry)
+
+    if sum(len(heap) for heap in self.heaps.values()) > 2 * len(self.entries) + 64:
+      self.compact()
+
+  def update(self, job):
+    if self.job_id(job) in self.entries:
+      self.push(job)
+
+  def remove(self, job):
+    job_id = self.job_id(job)
+    self._invalidate(job_id)
+    self.order.pop(job_id, None)
+    self.unassigned.discard(job_id)
+
+  def remove_project(self, project):
+    for job in list(project.jobs.values()):
+      self.remove(job)
+
+  def update_project(self, project):
+    for job in list(project.jobs.values()):
+      self.update(job)
+
+  def pop(self, skip, workerid, accept=None):
+    skipped = []
+    candidates = []
+
+    for kind, heap in self.heaps.items():
+      if accept and not accept(kind): continue
+
+      while heap:
+        entry = heapq.heappop(heap)
+        if not entry[-1]: continue
+
+        if self.job_id(entry[3]) in skip:
+          skipped.append(entry)
+          continue
+
+        candidates.append(entry)
+        break
+
+    found = min(candidates) if candidates else None
+
+    for entry in skipped + candidates:
+      if entry is not found:
+        heapq.heappush(self.heaps[self.kind(entry[3])], entry)
+
+    if found:
+      found[3].workers.append(workerid)
+      self.push(found[3])
+      return found[3]
+
+    return None
+
+  def compact(self):
+    for kind in list(self.heaps):
+      heap = [entry for entry in self.heaps[kind] if entry[-1]]
+      if heap:
+        heapq.heapify(heap)
+        self.heaps[kind] = heap
+      else:
+        del self.heaps[kind]
+
+  def _invalidate(self, job_id):
+    entry = self.entries.pop(job_id, None)
+    if entry:
+      entry[-1] = False
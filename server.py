@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-import os, re, json, shutil, logging, subprocess, traceback
+import os, re, json, logging, subprocess, traceback
 from threading import Thread, Event
 
 from logger import NET
@@ -8,18 +8,56 @@ from logger import setup as setup_logging
 
 from project import Projects, Project
 
-from flask import Flask, request, send_file, make_response, send_from_directory
+from flask import Flask, Request, Response, request, send_file, make_response, send_from_directory
 from flask_cors import cross_origin
 from wsgiserver import WSGIServer
+from tempfile import NamedTemporaryFile
+from util import ResponseCache, file_checksum, cached_version
+
+class UploadRequest(Request):
+  def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+    os.makedirs(projects.path_checking, exist_ok=True)
+    file = NamedTemporaryFile("wb+", dir=projects.path_checking, delete=False)
+    self.staged_files = getattr(self, "staged_files", []) + [file.name]
+    return file
+
+  def close(self):
+    super(UploadRequest, self).close()
+    for name in getattr(self, "staged_files", []):
+      if os.path.exists(name):
+        os.unlink(name)
 
 app = Flask(__name__)
+app.request_class = UploadRequest
+
+response_cache = ResponseCache()
+
+def send_segment(path):
+  checksum = file_checksum(path)
+  resp = send_file(path, conditional=False)
+  resp.set_etag(checksum)
+  resp.headers["checksum"] = checksum
+  return resp.make_conditional(request, accept_ranges=True, complete_length=os.path.getsize(path))
+
+def cached_json(key, build):
+  body, etag = response_cache.get(projects.generation, key, build)
+  resp = make_response(body)
+  resp.set_etag(etag)
+  return resp.make_conditional(request)
 
 @app.route("/scene/<projectid>/<scene>", methods=["GET"])
 @cross_origin()
 def get_scene(projectid, scene):
   if projectid not in projects:
     return "", 404
-  return send_from_directory(projects[projectid].path_encode, scene)
+
+  path = os.path.join(projects[projectid].path_encode, os.path.basename(scene))
+  if not os.path.isfile(path):
+    return "", 404
+
+  resp = send_segment(path)
+  projects.metrics.bytes_sent.inc(resp.content_length or 0, endpoint="scene")
+  return resp
 
 @app.route("/completed/<projectid>", methods=["GET"])
 @cross_origin()
@@ -36,28 +74,11 @@ def get_project(projectid):
 
   project = projects[projectid]
 
-  p = {}
-  p["projectid"] = project.projectid
-  p["input"] = project.path_in
-  p["frames"] = project.get_frames()
-  p["total_frames"] = project.input_total_frames
-  p["jobs"] = len(project.jobs)
-  p["total_jobs"] = project.total_jobs
-  p["status"] = project.status
-  p["encoder_params"] = project.encoder_params
-  p["ffmpeg_params"] = project.ffmpeg_params
-  p["encoder"] = project.encoder
-  p["scenes"] = project.scenes
-  p["priority"] = project.priority
-  p["workers"] = [job for job in project.jobs if len(project.jobs[job].workers) > 0]
-
-  return json.dumps(p)
+  fields = request.args["fields"].split(",") if "fields" in request.args else None
+  offset = int(request.args["offset"]) if "offset" in request.args else 0
+  limit = int(request.args["limit"]) if "limit" in request.args else None
 
-@app.route("/api/get_projects", methods=["GET"])
-@cross_origin()
-def get_projects():
-  rtn = []
-  for project in projects.values():
+  def build():
     p = {}
     p["projectid"] = project.projectid
     p["input"] = project.path_in
@@ -66,11 +87,49 @@ def get_projects():
     p["jobs"] = len(project.jobs)
     p["total_jobs"] = project.total_jobs
     p["status"] = project.status
-    p["size"] = sum([project.scenes[scene]["filesize"] for scene in project.scenes])
+    p["encoder_params"] = project.encoder_params
+    p["ffmpeg_params"] = project.ffmpeg_params
+    p["encoder"] = project.encoder
+    p["passes"] = project.passes
+
+    if offset or limit is not None:
+      scenes = sorted(project.scenes)
+      scenes = scenes[offset:] if limit is None else scenes[offset:offset + limit]
+      p["scenes"] = {scene: project.scenes[scene] for scene in scenes}
+    else:
+      p["scenes"] = project.scenes
+
     p["priority"] = project.priority
+    p["workers"] = [job for job in list(project.jobs) if len(project.jobs[job].workers) > 0]
+
+    if fields:
+      p = {key: p[key] for key in fields if key in p}
+
+    return p
 
-    rtn.append(p)
-  return json.dumps(rtn)
+  return cached_json(("project", projectid, tuple(fields) if fields else None, offset, limit), build)
+
+@app.route("/api/get_projects", methods=["GET"])
+@cross_origin()
+def get_projects():
+  def build():
+    rtn = []
+    for project in list(projects.values()):
+      p = {}
+      p["projectid"] = project.projectid
+      p["input"] = project.path_in
+      p["frames"] = project.get_frames()
+      p["total_frames"] = project.input_total_frames
+      p["jobs"] = len(project.jobs)
+      p["total_jobs"] = project.total_jobs
+      p["status"] = project.status
+      p["size"] = project.get_size()
+      p["priority"] = project.priority
+
+      rtn.append(p)
+    return rtn
+
+  return cached_json(("projects",), build)
 
 @app.route("/api/get_grain/<projectid>/<scene>", methods=["GET"])
 def get_grain(projectid, scene):
@@ -97,55 +156,137 @@ def is_job(projectid, scene):
 
   return "", 200
 
+def get_session():
+  return projects.sessions.get(request.headers.get("X-Session"))
+
+def session_expired(session):
+  return "X-Session" in request.headers and not session
+
+def get_workerid(session=None):
+  ip_list = request.headers.getlist("X-Forwarded-For")
+  return f"{ip_list[0] if ip_list else request.remote_addr}:{session.id if session else request.environ.get('REMOTE_PORT')}"
+
+@app.route("/api/register", methods=["POST"])
+def register():
+  content = request.json
+  client_versions = content["versions"] if "versions" in content else {}
+  encoders = [encoder for encoder in ["aom", "vpx"] if client_versions.get(encoder) == versions[encoder]]
+
+  session = projects.sessions.register(
+    client_versions,
+    encoders,
+    [str(mode) for mode in content["modes"]] if "modes" in content else ["2"],
+    cpus=int(content["cpus"]) if "cpus" in content else 0,
+    workers=int(content["workers"]) if "workers" in content else 0
+  )
+
+  logging.log(NET, "register", get_workerid(session), encoders, session.cpus, session.workers)
+
+  return json.dumps({
+    "session": session.id,
+    "encoders": encoders,
+    "versions": {"aom": versions["aom"], "vpx": versions["vpx"]},
+    "lease": projects.lease_time
+  })
+
+def job_info(job, workerid):
+  return {
+    "projectid": job.project.projectid,
+    "filename": job.filename,
+    "scene": job.scene,
+    "id": workerid,
+    "encoder": job.encoder,
+    "encoder_params": job.encoder_params,
+    "ffmpeg_params": job.ffmpeg_params,
+    "version": versions[job.encoder],
+    "start": str(job.start),
+    "frames": str(job.frames),
+    "grain": str(int(job.grain)),
+    "passes": job.passes,
+    "expires": str(job.leases.get(workerid, 0))
+  }
+
 @app.route("/api/get_job/<jobs>", methods=["GET"])
 def get_job(jobs):
   jobs = json.loads(jobs)
-  
-  ip_list = request.headers.getlist("X-Forwarded-For")
 
-  workerid = f"{ip_list[0] if ip_list else request.remote_addr}:{request.environ.get('REMOTE_PORT')}"
+  session = get_session()
+  if session_expired(session):
+    return "session not found", 401
 
-  new_job = projects.get_job(jobs, workerid)
+  workerid = get_workerid(session)
+
+  new_job = projects.get_job(jobs, workerid, session)
 
   if not new_job:
     return "", 404
 
   logging.log(NET, "sent", new_job.project.projectid, new_job.scene, "to", workerid, new_job.frames)
 
-  resp = make_response(send_file(new_job.path))
-  resp.headers["projectid"] = new_job.project.projectid
-  resp.headers["filename"] = new_job.filename
-  resp.headers["scene"] = new_job.scene
-  resp.headers["id"] = workerid
-  resp.headers["encoder"] = new_job.encoder
-  resp.headers["encoder_params"] = new_job.encoder_params
-  resp.headers["ffmpeg_params"] = new_job.ffmpeg_params
-  resp.headers["version"] = versions[new_job.encoder]
-  resp.headers["start"] = new_job.start
-  resp.headers["frames"] = new_job.frames
-  resp.headers["grain"] = int(new_job.grain)
+  resp = send_segment(new_job.path)
+  for key, value in job_info(new_job, workerid).items():
+    resp.headers[key] = value
+  projects.metrics.bytes_sent.inc(resp.content_length or 0, endpoint="get_job")
   return resp
 
+@app.route("/api/lease_jobs", methods=["POST"])
+def lease_jobs():
+  content = request.json
+  count = max(min(int(content["count"]), 64), 1) if "count" in content else 1
+
+  session = get_session()
+  if session_expired(session):
+    return "session not found", 401
+
+  workerid = get_workerid(session)
+
+  jobs = projects.get_jobs(content["jobs"] if "jobs" in content else [], workerid, count, session)
+
+  for job in jobs:
+    logging.log(NET, "leased", job.project.projectid, job.scene, "to", workerid, job.frames)
+
+  return json.dumps({
+    "id": workerid,
+    "jobs": [job_info(job, workerid) for job in jobs],
+    "remaining": len(projects.job_queue.unassigned)
+  })
+
+@app.route("/api/get_segment/<projectid>/<scene>", methods=["GET"])
+def get_segment(projectid, scene):
+  if projectid not in projects:
+    return "", 404
+
+  if scene not in projects[projectid].jobs:
+    return "", 404
+
+  resp = send_segment(projects[projectid].jobs[scene].path)
+  projects.metrics.bytes_sent.inc(resp.content_length or 0, endpoint="get_segment")
+  return resp
+
+@app.route("/api/heartbeat", methods=["POST"])
+def heartbeat():
+  content = request.json
+  return json.dumps({"done": projects.heartbeat(content["jobs"] if "jobs" in content else []), "lease": projects.lease_time})
+
 @app.route("/cancel_job", methods=["POST"])
 def cancel_job():
   client = request.form["client"] if "client" in request.form else request.form["id"]
   projectid = str(request.form["projectid"])
   scene_number = str(request.form["scene"])
 
-  with projects.projects_lock:
-    if projectid not in projects:
-      return "project not found", 404
+  if projectid not in projects:
+    return "project not found", 404
 
-    project = projects[projectid]
+  project = projects[projectid]
 
-    if scene_number not in project.jobs:
-      return "job not found", 404
+  if scene_number not in project.jobs:
+    return "job not found", 404
 
-    job = project.jobs[scene_number]
+  job = project.jobs[scene_number]
 
-    if client in job.workers:
-      job.workers.remove(client)
-      logging.log(NET, "cancel", projectid, scene_number, "by", client)
+  if client in job.workers:
+    projects.remove_worker(job, client)
+    logging.log(NET, "cancel", projectid, scene_number, "by", client)
 
   return "saved", 200
 
@@ -163,9 +304,91 @@ def receive():
   projectid = str(request.form["projectid"])
   scene_number = str(request.form["scene"])
   grain = int(request.form["grain"]) if "grain" in request.form else False
+  passes = request.form["passes"] if "passes" in request.form else "2"
+  segment = request.form["segment"] if "segment" in request.form else None
   file = request.files["file"]
 
-  return projects.check_job(projectid, client, encoder, encoder_params, ffmpeg_params, scene_number, grain, file), 200
+  if "async" in request.form and int(request.form["async"]):
+    result, ticket = projects.submit_job(projectid, client, encoder, encoder_params, ffmpeg_params, scene_number, grain, file, passes, segment)
+    return json.dumps({"result": result, "ticket": ticket}), 200
+
+  return projects.check_job(projectid, client, encoder, encoder_params, ffmpeg_params, scene_number, grain, file, passes, segment), 200
+
+@app.route("/api/upload", methods=["POST"])
+def open_upload():
+  content = request.json
+
+  if content["version"] != versions[content["encoder"]]:
+    return "bad encoder version", 200
+
+  projectid = str(content["projectid"])
+  if projectid not in projects:
+    return json.dumps({"result": "project not found"})
+
+  if str(content["scene"]) not in projects[projectid].jobs:
+    return json.dumps({"result": "job not found"})
+
+  upload = projects.uploads.open({
+    "client": content["client"],
+    "encoder": content["encoder"],
+    "encoder_params": content["encoder_params"],
+    "ffmpeg_params": content["ffmpeg_params"],
+    "projectid": projectid,
+    "scene": str(content["scene"]),
+    "grain": int(content["grain"]) if "grain" in content else False,
+    "passes": str(content["passes"]) if "passes" in content else "2",
+    "segment": content["segment"] if "segment" in content else None,
+    "stats": content["stats"] if "stats" in content else None
+  }, suffix=".ivf")
+
+  return json.dumps({"upload": upload.id, "offset": upload.offset, "chunk": projects.uploads.chunk_size})
+
+@app.route("/api/upload/<upload_id>", methods=["GET", "PUT"])
+def upload_chunk(upload_id):
+  if upload_id not in projects.uploads:
+    return "upload not found", 404
+
+  upload = projects.uploads[upload_id]
+
+  if request.method == "PUT":
+    if not projects.uploads.write(upload_id, int(request.args["offset"]), request.stream):
+      return json.dumps({"offset": upload.offset}), 409
+
+  return json.dumps({"offset": upload.offset})
+
+@app.route("/api/upload/<upload_id>/finish", methods=["POST"])
+def finish_upload(upload_id):
+  upload = projects.uploads.close(upload_id)
+  if not upload:
+    return "upload not found", 404
+
+  content = request.json
+  if upload.offset == 0 or content["sha256"] != upload.hash.hexdigest():
+    os.unlink(upload.path)
+    return json.dumps({"result": "bad upload", "ticket": None})
+
+  info = upload.info
+  if info["stats"]:
+    try:
+      projects.telemetry.timing(info["projectid"], info["encoder"], projects.worker_name(info["client"]), info["stats"])
+    except: pass
+
+  result, ticket = projects.submit_job(info["projectid"], info["client"], info["encoder"], info["encoder_params"], info["ffmpeg_params"], info["scene"], info["grain"], upload.path, info["passes"], info["segment"])
+
+  if not ticket and os.path.exists(upload.path):
+    os.unlink(upload.path)
+
+  return json.dumps({"result": result, "ticket": ticket})
+
+@app.route("/api/get_ticket/<ticket>", methods=["GET"])
+def get_ticket(ticket):
+  wait = min(float(request.args["wait"]), 2) if "wait" in request.args else 0
+  result = projects.verifier.result(ticket, timeout=wait)
+
+  if not result:
+    return "ticket not found", 404
+
+  return result, 200
 
 @app.route("/api/list_directory", methods=["GET"])
 @cross_origin()
@@ -207,7 +430,7 @@ def modify_project(projectid):
         "success": False,
         "reason": "priority must be a number"
       })
-    project.priority = changes["priority"]
+    projects.set_priority(project, changes["priority"])
 
   if "on_complete" in changes:
     project.action = changes["on_complete"]
@@ -239,6 +462,12 @@ def add_project():
         "success": False,
         "reason": "priority must be a number"
       })
+
+    if "passes" in content and str(content["passes"]) not in ["1", "2", "fast"]:
+      return json.dumps({
+        "success": False,
+        "reason": "passes must be 1, 2 or fast"
+      })
     
     if not content["input"]:
       return json.dumps({"success": False, "reason": "input is empty"})
@@ -276,7 +505,8 @@ def add_project():
         min_frames=content["min_frames"] if "min_frames" in content else -1,
         max_frames=content["max_frames"] if "max_frames" in content else -1,
         priority=content["priority"] if "priority" in content else 0,
-        id=id
+        id=id,
+        passes=str(content["passes"]) if "passes" in content else "2"
       ), content["on_complete"] if "on_complete" in content else "")
 
     return json.dumps({"success": True})
@@ -286,20 +516,56 @@ def add_project():
 @app.route("/api/get_home", methods=["GET"])
 @cross_origin()
 def get_home():
-  info = {
+  resp = make_response(json.dumps({
     "versions": {
       "libaom": versions["aom"],
       "libvpx": versions["vpx"],
       "dav1d": versions["dav1d"]
     },
     "projects": len(projects),
-    "jobs": len([job for pid in projects.projects for job in projects[pid].jobs]),
+    "jobs": len(projects.job_queue),
+    "sessions": len(projects.sessions),
+    "splitting": len(projects.splitting),
+    "actions": len(projects.action_executor),
     "frames per hour": {
-      "since": projects.telemetry["fph_time"],
-      "frames": projects.telemetry["fph"]
-    }
-  }
-  return json.dumps(info)
+      "since": projects.telemetry.since(),
+      "frames": projects.telemetry.frames_per_hour()
+    },
+    "verification": projects.verifier.status()
+  }))
+  resp.add_etag()
+  return resp.make_conditional(request)
+
+@app.route("/api/get_telemetry", methods=["GET"])
+@cross_origin()
+def get_telemetry():
+  return json.dumps(projects.telemetry.report())
+
+@app.route("/api/get_actions", methods=["GET"])
+@app.route("/api/get_actions/<projectid>", methods=["GET"])
+@cross_origin()
+def get_actions(projectid=None):
+  return json.dumps(projects.action_executor.status(projectid))
+
+@app.route("/api/cancel_actions/<projectid>", methods=["POST"])
+@cross_origin()
+def cancel_actions(projectid):
+  content = request.json or {}
+  if password and ("password" not in content or content["password"] != password):
+    logging.log(NET, "Bad password.")
+    return json.dumps({"success": False, "reason": "Bad password."})
+
+  if projectid not in projects:
+    return json.dumps({"success": False, "reason": "Project does not exist."})
+
+  cancelled = projects.cancel_actions(projects[projectid], int(content["id"]) if "id" in content else None)
+  logging.log(NET, "cancelled", cancelled, "actions for", projectid)
+
+  return json.dumps({"success": True, "cancelled": cancelled})
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+  return Response(projects.metrics.render(projects), mimetype="text/plain; version=0.0.4")
 
 @app.route("/api/get_info", methods=["GET"])
 @cross_origin()
@@ -316,32 +582,27 @@ def get_info():
   }
   return json.dumps(info)
 
-def get_dav1d_version():
-  if not shutil.which("dav1d"):
-    print("dav1d not found")
-    exit(1)
-
-  p = subprocess.run(["dav1d", "-v"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+def probe_dav1d(path):
+  p = subprocess.run([path, "-v"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
   return p.stdout.decode("utf-8").strip() + p.stderr.decode("utf-8").strip()
 
-def get_aomenc_version():
-  if not shutil.which("aomenc"):
-    print("aomenc not found")
-    exit(1)
-    
-  p = subprocess.run(["aomenc", "--help"], stdout=subprocess.PIPE)
+def probe_aomenc(path):
+  p = subprocess.run([path, "--help"], stdout=subprocess.PIPE)
   r = re.search(r"av1\s+-\s+(.+)\n", p.stdout.decode("utf-8"))
   return r.group(1).replace("(default)", "").strip()
 
-def get_vpxenc_version():
-  if not shutil.which("vpxenc"):
-    print("vpxenc not found")
-    exit(1)
-
-  p = subprocess.run(["vpxenc", "--help"], stdout=subprocess.PIPE)
+def probe_vpxenc(path):
+  p = subprocess.run([path, "--help"], stdout=subprocess.PIPE)
   r = re.search(r"vp9\s+-\s+(.+)\n", p.stdout.decode("utf-8"))
   return r.group(1).replace("(default)", "").strip()
 
+def get_version(cache_path, binary, probe):
+  version = cached_version(cache_path, binary, probe)
+  if version is None:
+    print(binary, "not found")
+    exit(1)
+  return version
+
 if __name__ == "__main__":
   import argparse
 
@@ -349,6 +610,9 @@ if __name__ == "__main__":
   parser.add_argument("--port", default=7899)
   parser.add_argument("--cwd", default=os.getcwd())
   parser.add_argument("--password", default=None)
+  parser.add_argument("--lease", default=300, help="seconds before an assignment without a heartbeat is reclaimed")
+  parser.add_argument("--split-workers", dest="split_workers", default=0, help="number of inputs split at the same time")
+  parser.add_argument("--action-workers", dest="action_workers", default=0, help="number of projects whose actions run at the same time")
   args = parser.parse_args()
 
   password = args.password
@@ -369,13 +633,14 @@ if __name__ == "__main__":
 
   logging.info("Working directory:", args.cwd)
 
+  path_versions = os.path.join(args.cwd, "versions.json")
   versions = {
-    "aom": get_aomenc_version(),
-    "vpx": get_vpxenc_version(),
-    "dav1d": get_dav1d_version()
+    "aom": get_version(path_versions, "aomenc", probe_aomenc),
+    "vpx": get_version(path_versions, "vpxenc", probe_vpxenc),
+    "dav1d": get_version(path_versions, "dav1d", probe_dav1d)
   }
 
-  projects = Projects(args.cwd)
+  projects = Projects(args.cwd, lease_time=int(args.lease), split_workers=int(args.split_workers), action_workers=int(args.action_workers))
 
   projects.load_projects()
 
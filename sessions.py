@@ -0,0 +1,47 @@
+import time, uuid
+from threading import Lock
+
+class Session:
+  def __init__(self, versions, encoders, modes, cpus=0, workers=0):
+    self.id = uuid.uuid4().hex
+    self.versions = versions
+    self.encoders = set(encoders)
+    self.modes = set(modes)
+    self.cpus = cpus
+    self.workers = workers
+    self.seen = time.time()
+
+  def accept(self, kind):
+    encoder, passes = kind
+    return encoder in self.encoders and passes in self.modes
+
+def legacy_accept(kind):
+  encoder, passes = kind
+  return passes == "2"
+
+class Sessions:
+  def __init__(self, ttl=86400):
+    self.ttl = ttl
+    self.sessions = {}
+    self.lock = Lock()
+
+  def __len__(self):
+    return len(self.sessions)
+
+  def register(self, versions, encoders, modes, cpus=0, workers=0):
+    session = Session(versions, encoders, modes, cpus, workers)
+    with self.lock:
+      self.expire()
+      self.sessions[session.id] = session
+    return session
+
+  def get(self, session_id):
+    session = self.sessions.get(session_id) if session_id else None
+    if session:
+      session.seen = time.time()
+    return session
+
+  def expire(self):
+    now = time.time()
+    for session_id in [k for k, v in self.sessions.items() if now - v.seen > self.ttl]:
+      del self.sessions[session_id]
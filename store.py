@@ -0,0 +1,77 @@
+import os, json, sqlite3
+from threading import Lock
+
+class Store:
+  def __init__(self, path):
+    self.path = path
+    self.lock = Lock()
+    self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    self.db.execute("PRAGMA journal_mode=WAL")
+    self.db.execute("PRAGMA synchronous=NORMAL")
+    self.db.execute("CREATE TABLE IF NOT EXISTS projects (projectid TEXT PRIMARY KEY, data TEXT NOT NULL)")
+    self.db.execute("CREATE TABLE IF NOT EXISTS scenes (projectid TEXT NOT NULL, scene TEXT NOT NULL, data TEXT NOT NULL, PRIMARY KEY (projectid, scene))")
+
+  def __len__(self):
+    with self.lock:
+      return self.db.execute("SELECT COUNT(*) FROM projects").fetchone()[0]
+
+  def _transaction(self, fn):
+    with self.lock:
+      self.db.execute("BEGIN IMMEDIATE")
+      try:
+        fn()
+      except:
+        self.db.execute("ROLLBACK")
+        raise
+      self.db.execute("COMMIT")
+
+  def _put_project(self, projectid, data):
+    self.db.execute(
+      "INSERT INTO projects (projectid, data) VALUES (?, ?) ON CONFLICT (projectid) DO UPDATE SET data = excluded.data",
+      (projectid, json.dumps(data)))
+
+  def _put_scenes(self, projectid, scenes):
+    self.db.execute("DELETE FROM scenes WHERE projectid = ?", (projectid,))
+    self.db.executemany(
+      "INSERT INTO scenes (projectid, scene, data) VALUES (?, ?, ?)",
+      [(projectid, scene, json.dumps(scenes[scene])) for scene in scenes])
+
+  def put_projects(self, projects, scenes={}):
+    def fn():
+      for projectid in projects:
+        self._put_project(projectid, projects[projectid])
+      for projectid in scenes:
+        self._put_scenes(projectid, scenes[projectid])
+
+    self._transaction(fn)
+
+  def put_scene(self, projectid, scene, data):
+    with self.lock:
+      self.db.execute(
+        "INSERT INTO scenes (projectid, scene, data) VALUES (?, ?, ?) ON CONFLICT (projectid, scene) DO UPDATE SET data = excluded.data",
+        (projectid, scene, json.dumps(data)))
+
+  def delete_project(self, projectid):
+    def fn():
+      self.db.execute("DELETE FROM projects WHERE projectid = ?", (projectid,))
+      self.db.execute("DELETE FROM scenes WHERE projectid = ?", (projectid,))
+
+    self._transaction(fn)
+
+  def get_projects(self):
+    with self.lock:
+      return {row[0]: json.loads(row[1]) for row in self.db.execute("SELECT projectid, data FROM projects ORDER BY rowid")}
+
+  def get_scenes(self, projectid):
+    with self.lock:
+      return {row[0]: json.loads(row[1]) for row in self.db.execute("SELECT scene, data FROM scenes WHERE projectid = ? ORDER BY scene", (projectid,))}
+
+  def import_json(self, path_projects, path_scenes):
+    projects = json.load(open(path_projects, "r"))
+    scenes = {}
+    for projectid in projects:
+      path = os.path.join(path_scenes, f"{projectid}.json")
+      if os.path.isfile(path):
+        scenes[projectid] = json.load(open(path, "r"))
+
+    self.put_projects(projects, scenes)
@@ -0,0 +1,139 @@
+import time
+from threading import Lock
+
+class Window:
+  def __init__(self, span=3600, buckets=60):
+    self.span = span
+    self.width = span / buckets
+    self.sums = [0] * buckets
+    self.counts = [0] * buckets
+    self.head = None
+    self.sum = 0
+    self.count = 0
+
+  def advance(self, now):
+    epoch = int(now // self.width)
+    if self.head is None:
+      self.head = epoch
+
+    if epoch <= self.head:
+      return
+
+    n = len(self.sums)
+    for e in range(self.head + 1, min(epoch, self.head + n) + 1):
+      i = e % n
+      self.sum -= self.sums[i]
+      self.count -= self.counts[i]
+      self.sums[i] = 0
+      self.counts[i] = 0
+
+    self.head = epoch
+
+  def add(self, value, now):
+    self.advance(now)
+    i = self.head % len(self.sums)
+    self.sums[i] += value
+    self.counts[i] += 1
+    self.sum += value
+    self.count += 1
+
+  def total(self, now):
+    self.advance(now)
+    return self.sum, self.count
+
+class Telemetry:
+  def __init__(self, span=3600, buckets=60):
+    self.span = span
+    self.buckets = buckets
+    self.series = {}
+    self.lock = Lock()
+    self.last = None
+
+  def _add(self, metric, value, now, labels):
+    for group in [("all", "")] + labels:
+      key = (group, metric)
+      if key not in self.series:
+        self.series[key] = Window(self.span, self.buckets)
+      self.series[key].add(value, now)
+
+  def _labels(self, projectid, encoder, worker):
+    return [("project", str(projectid)), ("encoder", encoder), ("worker", worker)]
+
+  def encode(self, projectid, encoder, worker, frames, size, latency):
+    now = time.time()
+    with self.lock:
+      labels = self._labels(projectid, encoder, worker)
+      self._add("frames", frames, now, labels)
+      self._add("bytes", size, now, labels)
+      self._add("latency", latency, now, labels)
+      self.last = now
+
+  def reject(self, projectid, encoder, worker, reason, latency=None):
+    now = time.time()
+    with self.lock:
+      labels = self._labels(projectid, encoder, worker)
+      self._add("rejected", 1, now, labels)
+      self._add(f"rejected:{reason}", 1, now, labels)
+      if latency is not None:
+        self._add("latency", latency, now, labels)
+
+  def timing(self, projectid, encoder, worker, stats):
+    now = time.time()
+    with self.lock:
+      labels = self._labels(projectid, encoder, worker)
+      if stats.get("decode"):
+        self._add("decode", stats["decode"], now, labels)
+      for p in stats.get("passes", []):
+        self._add(f"pass:{p['pass']}", p["seconds"], now, labels)
+
+  def frames_per_hour(self):
+    with self.lock:
+      key = (("all", ""), "frames")
+      if key not in self.series: return 0
+      return round(self.series[key].total(time.time())[0] * 3600 / self.span)
+
+  def since(self):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.last)) if self.last else 0
+
+  def report(self):
+    now = time.time()
+    scale = 3600 / self.span
+    groups = {}
+
+    with self.lock:
+      for key in list(self.series):
+        group, metric = key
+        total, count = self.series[key].total(now)
+        if count == 0:
+          del self.series[key]
+          continue
+
+        stats = groups.setdefault(group, {"frames": 0, "bytes": 0, "accepted": 0, "rejected": 0, "reasons": {}})
+        if metric == "frames":
+          stats["frames"] = round(total * scale)
+          stats["accepted"] = count
+        elif metric == "bytes":
+          stats["bytes"] = round(total * scale)
+        elif metric == "latency":
+          stats["latency"] = round(total / count, 2)
+        elif metric == "rejected":
+          stats["rejected"] = count
+        elif metric == "decode":
+          stats["decode_seconds"] = round(total / count, 2)
+        elif metric.startswith("pass:"):
+          stats.setdefault("pass_seconds", {})[metric.split(":", 1)[1]] = round(total / count, 2)
+        else:
+          stats["reasons"][metric.split(":", 1)[1]] = count
+
+    rtn = {"span": self.span, "since": self.since()}
+    for (kind, name), stats in groups.items():
+      uploads = stats["accepted"] + stats["rejected"]
+      stats["rejection_rate"] = round(stats["rejected"] / uploads, 3) if uploads else 0
+      stats["frames_per_hour"] = stats.pop("frames")
+      stats["bytes_per_hour"] = stats.pop("bytes")
+      if kind == "all":
+        rtn["all"] = stats
+      else:
+        rtn.setdefault(kind, {})[name] = stats
+
+    return rtn
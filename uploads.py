@@ -0,0 +1,64 @@
+import os, time, uuid, hashlib, tempfile
+from threading import Lock
+
+class Upload:
+  def __init__(self, path, info):
+    self.id = uuid.uuid4().hex
+    self.path = path
+    self.info = info
+    self.offset = 0
+    self.hash = hashlib.sha256()
+    self.updated = time.time()
+    self.lock = Lock()
+
+class Uploads:
+  def __init__(self, path, chunk_size=2**22, ttl=3600):
+    self.path = path
+    self.chunk_size = chunk_size
+    self.ttl = ttl
+    self.uploads = {}
+    self.lock = Lock()
+
+  def __contains__(self, upload_id):
+    return upload_id in self.uploads
+
+  def __getitem__(self, upload_id):
+    return self.uploads[upload_id]
+
+  def open(self, info, suffix=""):
+    os.makedirs(self.path, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=self.path)
+    os.close(fd)
+
+    upload = Upload(path, info)
+    with self.lock:
+      self.expire()
+      self.uploads[upload.id] = upload
+    return upload
+
+  def write(self, upload_id, offset, stream):
+    upload = self.uploads[upload_id]
+    with upload.lock:
+      if offset != upload.offset:
+        return False
+
+      with open(upload.path, "r+b") as f:
+        f.seek(offset)
+        for chunk in iter(lambda: stream.read(2**20), b""):
+          f.write(chunk)
+          upload.hash.update(chunk)
+          upload.offset += len(chunk)
+
+      upload.updated = time.time()
+      return True
+
+  def close(self, upload_id):
+    with self.lock:
+      return self.uploads.pop(upload_id, None)
+
+  def expire(self):
+    now = time.time()
+    for upload_id in [k for k, v in self.uploads.items() if now - v.updated > self.ttl]:
+      upload = self.uploads.pop(upload_id)
+      if os.path.exists(upload.path):
+        os.unlink(upload.path)
@@ -1,4 +1,5 @@
-import contextlib, os, tempfile
+import contextlib, os, tempfile, shutil, errno, json, hashlib
+from threading import Lock
 
 @contextlib.contextmanager
 def tmp_file(mode, content, suffix=""):
@@ -12,15 +13,88 @@ def tmp_file(mode, content, suffix=""):
   finally:
     os.unlink(tmp_name)
 
-@contextlib.contextmanager
-def tmp_save(file, path, suffix=""):
-  try:
-    tmp_name = ""
-    while not tmp_name or os.path.isfile(tmp_name):
-      tmp_name = os.path.join(path, next(tempfile._get_candidate_names())) + suffix
+def save_tmp(file, path, suffix=""):
+  tmp_name = ""
+  while not tmp_name or os.path.isfile(tmp_name):
+    tmp_name = os.path.join(path, next(tempfile._get_candidate_names())) + suffix
 
+  staged = getattr(file.stream, "name", None)
+  if isinstance(staged, str) and os.path.dirname(os.path.abspath(staged)) == os.path.abspath(path):
+    file.stream.close()
+    os.replace(staged, tmp_name)
+  else:
     file.save(tmp_name)
-    yield tmp_name
-  finally:
-    os.unlink(tmp_name)
 
+  return tmp_name
+
+def move_file(src, dst):
+  try:
+    os.replace(src, dst)
+  except OSError as e:
+    if e.errno != errno.EXDEV: raise
+    shutil.copyfile(src, dst + ".tmp")
+    os.replace(dst + ".tmp", dst)
+    os.unlink(src)
+
+class ResponseCache:
+  def __init__(self):
+    self.generation = None
+    self.responses = {}
+    self.lock = Lock()
+
+  def get(self, generation, key, build):
+    with self.lock:
+      if generation != self.generation:
+        self.generation = generation
+        self.responses = {}
+
+      if key in self.responses:
+        return self.responses[key]
+
+    body = json.dumps(build())
+    response = (body, hashlib.sha1(body.encode("utf-8")).hexdigest())
+
+    with self.lock:
+      if generation == self.generation:
+        self.responses[key] = response
+
+    return response
+
+checksums = {}
+
+def file_checksum(path):
+  stat = os.stat(path)
+  key = (path, stat.st_mtime, stat.st_size)
+  if key not in checksums:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+      for chunk in iter(lambda: f.read(2**20), b""):
+        h.update(chunk)
+    checksums[key] = h.hexdigest()
+  return checksums[key]
+
+def cached_version(cache_path, binary, probe):
+  path = shutil.which(binary)
+  if not path: return None
+  path = os.path.realpath(path)
+  stat = os.stat(path)
+
+  try:
+    cache = json.load(open(cache_path, "r"))
+  except:
+    cache = {}
+
+  entry = cache.get(path)
+  if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+    return entry["version"]
+
+  version = probe(path)
+  cache[path] = {"mtime": stat.st_mtime, "size": stat.st_size, "version": version}
+
+  try:
+    with open(f"{cache_path}.tmp", "w") as f:
+      json.dump(cache, f)
+    os.replace(f"{cache_path}.tmp", cache_path)
+  except: pass
+
+  return version
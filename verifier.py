@@ -0,0 +1,83 @@
+import os, time, uuid
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, wait
+
+class Verifier:
+  def __init__(self, workers=None, ticket_ttl=600, on_change=None):
+    self.workers = workers or os.cpu_count() or 1
+    self.executor = ThreadPoolExecutor(max_workers=self.workers)
+    self.ticket_ttl = ticket_ttl
+    self.on_change = on_change
+    self.tickets = {}
+    self.lock = Lock()
+
+    self.queued = 0
+    self.running = 0
+    self.latency = 0
+    self.processed = 0
+
+  def submit(self, fn, *args):
+    ticket = {
+      "id": uuid.uuid4().hex,
+      "submitted": time.time(),
+      "finished": None,
+      "future": None
+    }
+
+    with self.lock:
+      self._expire()
+      self.tickets[ticket["id"]] = ticket
+      self.queued += 1
+    self._changed()
+
+    ticket["future"] = self.executor.submit(self._run, ticket, fn, *args)
+    return ticket["id"]
+
+  def _run(self, ticket, fn, *args):
+    with self.lock:
+      self.queued -= 1
+      self.running += 1
+    self._changed()
+
+    try:
+      return fn(*args)
+    finally:
+      ticket["finished"] = time.time()
+      with self.lock:
+        self.running -= 1
+        self.processed += 1
+        elapsed = ticket["finished"] - ticket["submitted"]
+        self.latency = elapsed if self.processed == 1 else self.latency * 0.9 + elapsed * 0.1
+      self._changed()
+
+  def _changed(self):
+    if self.on_change:
+      self.on_change()
+
+  def _expire(self):
+    now = time.time()
+    expired = [k for k, v in self.tickets.items() if v["finished"] and now - v["finished"] > self.ticket_ttl]
+    for k in expired:
+      del self.tickets[k]
+
+  def result(self, ticket_id, timeout=None):
+    if ticket_id not in self.tickets:
+      return None
+
+    future = self.tickets[ticket_id]["future"]
+    if not wait([future], timeout=timeout).done:
+      return "pending"
+
+    try:
+      return future.result()
+    except:
+      return "bad upload"
+
+  def status(self):
+    return {
+      "workers": self.workers,
+      "queued": self.queued,
+      "running": self.running,
+      "processed": self.processed,
+      "latency": round(self.latency, 2)
+    }